@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Process-wide caches shared by all Poll and Survey blocks in a worker.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+from markdown import markdown
+
+
+class LRUCache(object):
+    """
+    A small thread-safe, size-bounded least-recently-used cache.
+
+    Keeps hit/miss/eviction counters so that deployments can check how
+    effective each cache is.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if it is not cached.
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Re-insert to mark the key as most recently used.
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Store value under key, evicting the least recently used entries if needed.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, factory):
+        """
+        Return the cached value for key, calling factory() to compute and store it on a miss.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """
+        Drop all entries and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Return a dict describing the current size and effectiveness of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class MarkdownCache(object):
+    """
+    Renders markdown to HTML, remembering the result for each distinct source text.
+
+    Entries are keyed by a hash of the source text and the markdown extensions in use, so they never go
+    stale and can be shared between processes through an optional Django cache.
+    """
+    key_prefix = 'xblock-poll:markdown:'
+
+    def __init__(self, maxsize=2048, extensions=()):
+        self.extensions = tuple(extensions)
+        self.local = LRUCache(maxsize=maxsize)
+        self.shared_hits = 0
+        self.renders = 0
+
+    def cache_key(self, text):
+        """
+        Return the cache key for the given markdown source.
+        """
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        digest = hashlib.sha1('|'.join(self.extensions))
+        digest.update('\0')
+        digest.update(text)
+        return digest.hexdigest()
+
+    def render(self, text, shared_cache=None):
+        """
+        Return text rendered as HTML.
+
+        shared_cache may be a Django cache to look the result up in after the in-process cache misses.
+        """
+        if not text:
+            return u''
+        key = self.cache_key(text)
+        html = self.local.get(key)
+        if html is not None:
+            return html
+        if shared_cache is not None:
+            html = shared_cache.get(self.key_prefix + key)
+        if html is None:
+            html = markdown(text, extensions=list(self.extensions))
+            self.renders += 1
+            if shared_cache is not None:
+                shared_cache.set(self.key_prefix + key, html)
+        else:
+            self.shared_hits += 1
+        self.local.set(key, html)
+        return html
+
+    def clear(self):
+        """
+        Drop the in-process entries and reset the counters.
+        """
+        self.local.clear()
+        self.shared_hits = self.renders = 0
+
+    def stats(self):
+        """
+        Return the in-process cache stats, along with shared cache hits and actual markdown renders.
+        """
+        stats = self.local.stats()
+        stats.update({'shared_hits': self.shared_hits, 'renders': self.renders})
+        return stats
+
+
+class SnapshotCache(object):
+    """
+    Keeps serialised results payloads, keyed by a version that changes whenever the payload would.
+
+    Since a new vote or a settings change gives a new key, entries never need to be invalidated; old
+    ones just drop out of the LRU. The age of each snapshot served is recorded, to show how long
+    results stay unchanged between votes.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.local = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.total_age = 0.0
+        self.max_age = 0.0
+
+    def get_or_build(self, key, build):
+        """
+        Return the snapshot stored under key, calling build() to create it on a miss.
+        """
+        now = time.time()
+        entry = self.local.get(key)
+        if entry is None:
+            entry = (now, build())
+            self.local.set(key, entry)
+            with self._lock:
+                self.builds += 1
+        else:
+            age = now - entry[0]
+            with self._lock:
+                self.total_age += age
+                self.max_age = max(self.max_age, age)
+        return entry[1]
+
+    def clear(self):
+        """
+        Drop all snapshots and reset the counters.
+        """
+        self.local.clear()
+        with self._lock:
+            self.builds = 0
+            self.total_age = self.max_age = 0.0
+
+    def stats(self):
+        """
+        Return the LRU stats, along with the number of snapshots built and the mean and max age of those served.
+        """
+        stats = self.local.stats()
+        with self._lock:
+            stats.update({
+                'builds': self.builds,
+                'mean_age': self.total_age / stats['hits'] if stats['hits'] else 0.0,
+                'max_age': self.max_age,
+            })
+        return stats
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Vote counter backends.
+
+A block's tally is a (possibly nested) dict of counts, e.g. {'R': 3, 'B': 1} for a poll or
+{'enjoy': {'Y': 3, 'N': 1}} for a survey. A single count is addressed by its path in the tally,
+e.g. ('R',) or ('enjoy', 'Y'). Backends apply vote deltas to those counts and read them back.
+"""
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+def get_count(tally, path):
+    """
+    Return the count at path in tally.
+    """
+    for key in path:
+        tally = tally[key]
+    return tally
+
+
+def set_count(tally, path, value):
+    """
+    Set the count at path in tally.
+    """
+    for key in path[:-1]:
+        tally = tally[key]
+    tally[path[-1]] = value
+
+
+def iter_counts(tally, prefix=()):
+    """
+    Yield (path, count) for every count in tally.
+    """
+    for key, value in tally.items():
+        if isinstance(value, dict):
+            for item in iter_counts(value, prefix + (key,)):
+                yield item
+        else:
+            yield prefix + (key,), value
+
+
+def merge_counts(blank, stored):
+    """
+    Return a copy of blank with every count that stored also has copied over.
+    """
+    tally = copy.deepcopy(blank)
+    stored_counts = dict(iter_counts(stored or {}))
+    for path, __ in iter_counts(blank):
+        if path in stored_counts:
+            set_count(tally, path, stored_counts[path])
+    return tally
+
+
+def changed_counts(old, new):
+    """
+    Return [path, count] for every count in new that is missing from or different in old.
+    """
+    old_counts = dict(iter_counts(old))
+    return [[list(path), count] for path, count in iter_counts(new) if old_counts.get(path) != count]
+
+
+def tally_version(tally):
+    """
+    Return a hash identifying the counts in tally.
+    """
+    return hashlib.sha1(json.dumps(tally, sort_keys=True)).hexdigest()
+
+
+def increment(cache, key, delta, initial):
+    """
+    Atomically add delta to the count at key in cache, creating it with value initial if needed.
+    """
+    # add() is a no-op when the key exists, so only the first process to get here seeds the count.
+    cache.add(key, initial, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # The key was evicted between add() and incr().
+        cache.add(key, initial + delta, None)
+        return initial + delta
+
+
+class TallyFieldBackend(object):
+    """
+    Keeps counts in the block's tally field only.
+
+    Every vote is a read-modify-write of the block's user_state_summary row, so concurrent votes can
+    overwrite each other. This is the default, and needs no extra infrastructure.
+    """
+    # pylint: disable=no-self-use
+    # Counts come from the block's own field data, so votes made through other requests are not seen.
+    shared = False
+
+    def __init__(self, xblock_settings=None):
+        pass
+
+    def update(self, block, deltas):
+        """
+        Apply {path: delta} to the block's counts.
+
+        Changing a vote to the same answer leaves the tally untouched, so it is not written back.
+        """
+        deltas = [(path, delta) for path, delta in deltas.items() if delta]
+        if not deltas:
+            return
+        tally = block.tally
+        for path, delta in deltas:
+            set_count(tally, path, get_count(tally, path) + delta)
+
+    def tally(self, block):
+        """
+        Return the block's tally with current counts.
+        """
+        return block.tally
+
+    def tallies(self, stored):
+        """
+        Return {usage id: tally with current counts}, given {usage id: tally field value} for several blocks.
+        """
+        return stored
+
+    def fold(self, block):
+        """
+        Nothing to do: the tally field already holds every count.
+        """
+        return block.tally
+
+
+class CacheBackend(object):
+    """
+    Keeps counts in a Django cache, using its atomic incr() so concurrent votes are never lost.
+
+    Counts are seeded from the tally field the first time they are used. The cache must be shared by
+    all LMS processes (e.g. memcached or redis) and must not expire counter keys on its own.
+
+    Each count can be spread over several shards (COUNTER_SHARDS), picked by hashing the learner's id,
+    so that votes from different learners do not all hit the same cache key. With a single shard every
+    new count is written back to the tally field, so the field stays a usable fallback if the cache is
+    flushed. With more than one shard the field is left alone while voting, since writing it would
+    bring back the single hot row; fold() copies the totals into it instead.
+
+    A learner's vote can be taken back from a shard that never counted it, e.g. after fold() or when
+    the vote was counted in the tally field. Caches such as memcached do not decrement below zero, so
+    the other shards store their count plus shard_offset, which is subtracted when they are read.
+    """
+    key_prefix = 'xblock-poll:counter'
+    shard_offset = 1 << 32
+    # Every read sees the votes recorded by all processes.
+    shared = True
+
+    def __init__(self, xblock_settings=None):
+        from django.core.cache import caches  # pylint: disable=import-error
+        xblock_settings = xblock_settings or {}
+        self.cache_alias = xblock_settings.get('COUNTER_CACHE', 'default')
+        self.cache = caches[self.cache_alias]
+        self.shards = max(int(xblock_settings.get('COUNTER_SHARDS', 1)), 1)
+
+    def cache_key(self, block, path, shard=0):
+        """
+        Return the cache key for one shard of one of the block's counts.
+        """
+        return self.counter_key(unicode(block.scope_ids.usage_id), path, shard)
+
+    def counter_key(self, usage_id, path, shard=0):
+        """
+        Return the cache key for one shard of one count of the block with the given usage id.
+        """
+        key = [usage_id, list(path)]
+        if shard:
+            key.append(shard)
+        digest = hashlib.sha1(json.dumps(key)).hexdigest()
+        return u'{}:{}'.format(self.key_prefix, digest)
+
+    def shard_for(self, block):
+        """
+        Return the shard that the current learner's votes go to.
+        """
+        if self.shards == 1:
+            return 0
+        user_id = unicode(block.scope_ids.user_id).encode('utf-8')
+        return int(hashlib.sha1(user_id).hexdigest()[:8], 16) % self.shards
+
+    def initial_value(self, tally, path, shard):
+        """
+        Return the value that a shard of the count at path is created with.
+
+        Only the first shard starts from the tally field; the others start from zero, stored with an offset.
+        """
+        return get_count(tally, path) if shard == 0 else self.shard_offset
+
+    def shard_keys(self, block, tally):
+        """
+        Return {cache key: (path, shard)} for every shard of every count in tally.
+        """
+        return {
+            key: (path, shard)
+            for key, (__, path, shard) in self.counter_keys({unicode(block.scope_ids.usage_id): tally}).items()
+        }
+
+    def counter_keys(self, tallies):
+        """
+        Return {cache key: (usage id, path, shard)} for every shard of every count in {usage id: tally}.
+        """
+        return {
+            self.counter_key(usage_id, path, shard): (usage_id, path, shard)
+            for usage_id, tally in tallies.items()
+            for path, __ in iter_counts(tally)
+            for shard in range(self.shards)
+        }
+
+    def update(self, block, deltas):
+        """
+        Apply {path: delta} to the block's counts.
+        """
+        shard = self.shard_for(block)
+        tally = block.tally
+        for path, delta in deltas.items():
+            if not delta:
+                continue
+            initial = self.initial_value(tally, path, shard)
+            value = increment(self.cache, self.cache_key(block, path, shard), delta, initial)
+            if self.shards == 1:
+                set_count(tally, path, value)
+
+    def tally(self, block):
+        """
+        Return the block's tally with current counts, summed over all shards.
+
+        A missing first shard falls back to the value in the tally field.
+        """
+        usage_id = unicode(block.scope_ids.usage_id)
+        return self.tallies({usage_id: block.tally})[usage_id]
+
+    def tallies(self, stored):
+        """
+        Return {usage id: tally with current counts}, given {usage id: tally field value} for several blocks.
+
+        All the counts are read with a single get_many().
+        """
+        tallies = copy.deepcopy(stored)
+        keys = self.counter_keys(tallies)
+        values = self.cache.get_many(keys.keys())
+        for key, (usage_id, path, shard) in keys.items():
+            if shard == 0 and key in values:
+                set_count(tallies[usage_id], path, values[key])
+        for key, (usage_id, path, shard) in keys.items():
+            if shard != 0 and key in values:
+                count = values[key] - self.shard_offset
+                set_count(tallies[usage_id], path, get_count(tallies[usage_id], path) + count)
+        return tallies
+
+    def fold(self, block):
+        """
+        Copy the totals over all shards into the tally field, and reset the shards to start from it.
+
+        Votes recorded while this runs may be lost, so run it while the poll is quiet.
+        """
+        tally = self.tally(block)
+        block.tally = tally
+        self.cache.delete_many(self.shard_keys(block, tally).keys())
+        return tally
+
+
+class VoteBuffer(object):
+    """
+    Collects vote deltas for cache counters in memory, and applies them in batches.
+
+    Deltas for the same counter are summed, so a burst of votes turns into one incr() per counter.
+    The buffer is flushed by a background thread every `interval` seconds, and straight away once
+    `max_votes` votes are waiting. Votes still buffered when a process is killed are lost.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.pending_votes = 0
+        self.oldest_vote = None
+        self.max_votes = 100
+        self.interval = 1.0
+        self.flusher = None
+        self.flushes = 0
+        self.last_flush_delay = 0.0
+        self.max_flush_delay = 0.0
+        self.last_flush_duration = 0.0
+
+    def add(self, cache_alias, deltas, max_votes, interval):
+        """
+        Buffer one vote, given as {cache key: (delta, initial value)}.
+        """
+        with self.lock:
+            self.max_votes, self.interval = max_votes, interval
+            for key, (delta, initial) in deltas.items():
+                entry = self.pending.setdefault((cache_alias, key), [0, initial])
+                entry[0] += delta
+            self.pending_votes += 1
+            if self.oldest_vote is None:
+                self.oldest_vote = time.time()
+            flush_now = self.pending_votes >= self.max_votes
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self.run, name='xblock-poll-vote-buffer')
+                self.flusher.daemon = True
+                self.flusher.start()
+        if flush_now:
+            # This runs in the learner's vote request, which must still succeed: the deltas that could not be
+            # applied stay in the buffer for the background flusher.
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Could not flush buffered poll votes; they will be retried.")
+
+    def pending_delta(self, cache_alias, key):
+        """
+        Return the change to the count at key that is still waiting in this process' buffer.
+        """
+        with self.lock:
+            return self.pending.get((cache_alias, key), (0, 0))[0]
+
+    def flush(self):
+        """
+        Apply all buffered deltas to their counters.
+        """
+        from django.core.cache import caches  # pylint: disable=import-error
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            oldest_vote, self.oldest_vote = self.oldest_vote, None
+            self.pending_votes = 0
+        if not pending:
+            return
+        start = time.time()
+        for index, ((cache_alias, key), (delta, initial)) in enumerate(pending.items()):
+            try:
+                if delta:
+                    increment(caches[cache_alias], key, delta, initial)
+            except Exception:
+                # Keep whatever was not applied for the next flush.
+                with self.lock:
+                    for item_key, (item_delta, item_initial) in pending.items()[index:]:
+                        entry = self.pending.setdefault(item_key, [0, item_initial])
+                        entry[0] += item_delta
+                    self.oldest_vote = min(self.oldest_vote or oldest_vote, oldest_vote)
+                raise
+        end = time.time()
+        with self.lock:
+            self.flushes += 1
+            self.last_flush_duration = end - start
+            self.last_flush_delay = end - oldest_vote
+            self.max_flush_delay = max(self.max_flush_delay, self.last_flush_delay)
+
+    def run(self):
+        """
+        Flush the buffer every `interval` seconds.
+        """
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Could not flush buffered poll votes.")
+
+    def stats(self):
+        """
+        Return the buffer depth and flush timings.
+
+        The flush delay is how long the oldest vote in a batch waited before it was applied, i.e. how
+        far behind the shared counts could be.
+        """
+        with self.lock:
+            return {
+                'pending_votes': self.pending_votes,
+                'pending_counters': len(self.pending),
+                'flushes': self.flushes,
+                'last_flush_duration': self.last_flush_duration,
+                'last_flush_delay': self.last_flush_delay,
+                'max_flush_delay': self.max_flush_delay,
+            }
+
+
+# Shared by every block in this process.
+VOTE_BUFFER = VoteBuffer()
+
+
+class BufferedCacheBackend(CacheBackend):
+    """
+    A cache backend that adds votes to the process' VOTE_BUFFER instead of incrementing counters directly.
+
+    Shared counts lag behind by at most VOTE_BUFFER_INTERVAL seconds (or VOTE_BUFFER_MAX_VOTES votes);
+    counts read in the same process include its own buffered votes. The tally field is not updated
+    while voting; use fold() to copy the counts into it.
+    """
+
+    def __init__(self, xblock_settings=None):
+        super(BufferedCacheBackend, self).__init__(xblock_settings)
+        xblock_settings = xblock_settings or {}
+        self.max_votes = int(xblock_settings.get('VOTE_BUFFER_MAX_VOTES', 100))
+        self.interval = float(xblock_settings.get('VOTE_BUFFER_INTERVAL', 1.0))
+
+    def update(self, block, deltas):
+        shard = self.shard_for(block)
+        tally = block.tally
+        VOTE_BUFFER.add(
+            self.cache_alias,
+            {
+                self.cache_key(block, path, shard): (delta, self.initial_value(tally, path, shard))
+                for path, delta in deltas.items() if delta
+            },
+            self.max_votes,
+            self.interval,
+        )
+
+    def tallies(self, stored):
+        tallies = super(BufferedCacheBackend, self).tallies(stored)
+        for key, (usage_id, path, __) in self.counter_keys(tallies).items():
+            delta = VOTE_BUFFER.pending_delta(self.cache_alias, key)
+            if delta:
+                set_count(tallies[usage_id], path, get_count(tallies[usage_id], path) + delta)
+        return tallies
+
+    def fold(self, block):
+        VOTE_BUFFER.flush()
+        return super(BufferedCacheBackend, self).fold(block)
+
+
+BACKENDS = {
+    'tally_field': TallyFieldBackend,
+    'cache': CacheBackend,
+}
+
+
+def get_backend(xblock_settings):
+    """
+    Return the counter backend selected by the COUNTER_BACKEND settings bucket key.
+
+    The cache backend can buffer votes in memory, if VOTE_BUFFER is set.
+    """
+    name = xblock_settings.get('COUNTER_BACKEND') or 'tally_field'
+    if name == 'cache' and xblock_settings.get('VOTE_BUFFER'):
+        return BufferedCacheBackend(xblock_settings)
+    return BACKENDS[name](xblock_settings)
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Helpers for writing CSV exports of learners' answers without holding every row in memory.
+"""
+from contextlib import closing
+import csv
+import datetime
+import hashlib
+import itertools
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import uuid
+import zipfile
+
+try:
+    import ujson  # pylint: disable=import-error
+    HAS_UJSON = True
+except ImportError:
+    HAS_UJSON = False
+
+log = logging.getLogger(__name__)
+
+# Rows are pulled from prepare_data() and written to the report this many at a time.
+CHUNK_SIZE = 1000
+# StudentModule rows are read from the database this many per query.
+BATCH_SIZE = 1000
+# The columns an export needs from each StudentModule row and its learner.
+EXPORT_FIELDS = ('student_id', 'student__username', 'student__email', 'state')
+# Reports up to this many bytes are kept in memory until they are stored; larger ones spill to disk.
+SPOOL_SIZE = 4 * 1024 * 1024
+# How many blocks a course export works on at once.
+COURSE_CONCURRENCY = 4
+# Incremental exports re-read rows modified up to this many seconds before the previous export started, so that
+# changes committed while it ran are not missed.
+SNAPSHOT_OVERLAP = 300
+# Where export snapshots are saved in the report storage.
+SNAPSHOT_DIRECTORY = 'xblock-poll/export-snapshots'
+
+
+def chunks(rows, size=CHUNK_SIZE):
+    """
+    Yield lists of at most size rows from the rows iterable, reading only one list ahead.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def keyset_batches(queryset, fields, batch_size=BATCH_SIZE):
+    """
+    Yield tuples of the given fields for every row of queryset, reading batch_size rows per query.
+
+    Rows come in primary key order, and each query starts after the last key of the previous batch instead of
+    using OFFSET, so every query is a short range scan however far into the export it is. Only the batch being
+    yielded is held in memory.
+    """
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch.values_list('pk', *fields)[:batch_size])
+        for row in batch:
+            yield row[1:]
+        if len(batch) < batch_size:
+            return
+        last_pk = batch[-1][0]
+
+
+def json_decoder(loads):
+    """
+    Return a decoder that parses the whole state with loads().
+    """
+    def decode(state, key):
+        """
+        Return the value of key in the state JSON object, or None.
+        """
+        return loads(state).get(key)
+    return decode
+
+
+# Decodes a single value where it starts in the state, without parsing the rest.
+VALUE_DECODER = json.JSONDecoder()
+# Compiled patterns for extract(), by key.
+KEY_PATTERNS = {}
+
+
+def extract(state, key):
+    """
+    Return the value of key in the state JSON object, decoding only that value.
+
+    The first occurrence of the key is only trusted when no other object has been opened before it, i.e. when it
+    is a top-level key. States where that cannot be told cheaply are parsed in full.
+    """
+    if key not in KEY_PATTERNS:
+        KEY_PATTERNS[key] = re.compile(re.escape(json.dumps(key)) + r'\s*:\s*')
+    match = KEY_PATTERNS[key].search(state)
+    if match is None or state.count('{', 0, match.start()) != 1 or state[match.start() - 1] == '\\':
+        return json.loads(state).get(key)
+    return VALUE_DECODER.raw_decode(state, match.end())[0]
+
+
+DECODERS = {
+    'json': json_decoder(json.loads),
+    'extract': extract,
+}
+if HAS_UJSON:
+    DECODERS['ujson'] = json_decoder(ujson.loads)
+
+
+def get_decoder(name='auto'):
+    """
+    Return the state decoder called name, one of DECODERS' keys or 'auto'.
+
+    'auto' uses ujson when it is installed, and the targeted extractor otherwise.
+    """
+    if name == 'auto':
+        name = 'ujson' if HAS_UJSON else 'extract'
+    return DECODERS[name]
+
+
+def votes(rows, key, decoder, keep_empty=False):
+    """
+    Yield (user id, username, email, vote) for each (user id, username, email, state) row with a vote under key.
+
+    Rows whose state does not mention key are skipped without being decoded at all. With keep_empty, rows without
+    a vote are yielded too, with a vote of None.
+    """
+    marker = json.dumps(key)
+    for user_id, username, email, state in rows:
+        vote = decoder(state, key) if state and marker in state else None
+        if vote:
+            yield user_id, username, email, vote
+        elif keep_empty:
+            yield user_id, username, email, None
+
+
+class Snapshot(object):
+    """
+    Every learner's vote as of an export, kept in a SQLite database so that later exports only read changed rows.
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS votes (user_id INTEGER PRIMARY KEY, username TEXT, email TEXT, vote TEXT)'
+        )
+
+    def merge(self, rows):
+        """
+        Record the vote of each (user id, username, email, vote) row, forgetting learners whose vote is None.
+
+        Returns the number of rows merged.
+        """
+        count = 0
+        for chunk in chunks(rows):
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO votes VALUES (?, ?, ?, ?)',
+                [(user_id, username, email, json.dumps(vote)) for user_id, username, email, vote in chunk if vote]
+            )
+            self.connection.executemany(
+                'DELETE FROM votes WHERE user_id = ?',
+                [(user_id,) for user_id, __, __, vote in chunk if not vote]
+            )
+            count += len(chunk)
+        self.connection.commit()
+        return count
+
+    def votes(self):
+        """
+        Yield (user id, username, email, vote) for every learner in the snapshot, in user id order.
+        """
+        cursor = self.connection.execute('SELECT user_id, username, email, vote FROM votes ORDER BY user_id')
+        for user_id, username, email, vote in cursor:
+            yield user_id, username, email, json.loads(vote)
+
+    def close(self):
+        self.connection.close()
+
+
+def modified_since(timestamp):
+    """
+    Return the datetime to compare StudentModule.modified with, for a POSIX timestamp.
+    """
+    # pylint: disable=import-error
+    from django.conf import settings
+    from django.utils import timezone
+    if settings.USE_TZ:
+        return datetime.datetime.fromtimestamp(timestamp, timezone.utc)
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+def snapshot_prefix(block_id):
+    """
+    Return the start of the file names of the export snapshots of the block with the given usage id.
+    """
+    return '{}-'.format(hashlib.sha1(block_id).hexdigest())
+
+
+def snapshot_name(block_id):
+    """
+    Return a new storage name for an export snapshot of the block with the given usage id.
+
+    Each snapshot gets a random name, so that it can't be guessed, and concurrent exports never write to the same
+    file.
+    """
+    return '{}/{}{}.sqlite3'.format(SNAPSHOT_DIRECTORY, snapshot_prefix(block_id), uuid.uuid4().hex)
+
+
+def fetch_snapshot(storage, info, path):
+    """
+    Copy the snapshot described by info, a previous export's result['snapshot'], from storage to path.
+
+    Returns the timestamp from which changes must be merged into it, or None if there is no usable snapshot and
+    every row has to be read.
+    """
+    if not info or not storage.exists(info['name']):
+        return None
+    source = storage.open(info['name'], 'rb')
+    try:
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+    finally:
+        source.close()
+    return info['high_water_mark']
+
+
+def store_snapshot(storage, name, path):
+    """
+    Save the snapshot at path to storage as a new file, and return its name.
+
+    The storage can pick another name than the one asked for if that is taken, so use the name returned.
+    """
+    from django.core.files import File  # pylint: disable=import-error
+    with open(path, 'rb') as snapshot:
+        return storage.save(name, File(snapshot))
+
+
+def delete_snapshot(storage, info):
+    """
+    Delete the snapshot described by info, an export's result['snapshot'], if it is still there.
+    """
+    if info and storage.exists(info['name']):
+        storage.delete(info['name'])
+
+
+def delete_stale_snapshots(storage, block_id, keep=None):
+    """
+    Delete every export snapshot of the block with the given usage id, except the one named keep.
+
+    This removes the snapshots replaced by a newer export, and those of exports whose result was never recorded.
+    """
+    try:
+        __, files = storage.listdir(SNAPSHOT_DIRECTORY)
+    except OSError:
+        # Nothing has been saved in this storage yet.
+        return
+    prefix = snapshot_prefix(block_id)
+    for filename in files:
+        name = '{}/{}'.format(SNAPSHOT_DIRECTORY, filename)
+        if filename.startswith(prefix) and name != keep:
+            storage.delete(name)
+
+
+def encode_row(row):
+    """
+    Return row with unicode cells encoded as UTF-8, as the Python 2 csv module requires.
+    """
+    return [cell.encode('utf-8') if isinstance(cell, unicode) else cell for cell in row]
+
+
+def write_csv(rows, chunk_size=CHUNK_SIZE, output=None):
+    """
+    Write rows to output, by default a new temporary file, as CSV, a chunk at a time, and return it rewound.
+
+    The caller owns the file and should close it once the report has been stored.
+    """
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    writer = csv.writer(output)
+    for chunk in chunks(rows, chunk_size):
+        writer.writerows([encode_row(row) for row in chunk])
+    output.seek(0)
+    return output
+
+
+def write_incremental_report(block, storage, name, previous, started, chunk_size=CHUNK_SIZE):
+    """
+    Bring the block's export snapshot up to date and write the CSV report from it.
+
+    previous is the snapshot entry of the last export's result, if any, and started the time this export started.
+    The updated snapshot is saved to storage as a new file, asking for name; the previous one is left for
+    delete_stale_snapshots() once this export's result is recorded.
+    Returns the report, as write_csv() does, and the snapshot entry for this export's result.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'snapshot.sqlite3')
+        since = fetch_snapshot(storage, previous, path)
+        snapshot = Snapshot(path)
+        try:
+            changed_rows = block.update_snapshot(snapshot, since)
+            output = write_csv(block.prepare_data(snapshot.votes()), chunk_size)
+        finally:
+            snapshot.close()
+        name = store_snapshot(storage, name, path)
+    finally:
+        shutil.rmtree(directory)
+    return output, {
+        'name': name,
+        'high_water_mark': started - SNAPSHOT_OVERLAP,
+        'changed_rows': changed_rows,
+    }
+
+
+def export_block_file(task):
+    """
+    Write the CSV export of a block to a file, in a worker thread of write_course_archive().
+
+    task is (block, path, chunk_size). Returns None, or a description of the error if the export failed.
+    """
+    from django.db import connections  # pylint: disable=import-error
+    block, path, chunk_size = task
+    try:
+        with open(path, 'wb') as output:
+            write_csv(block.prepare_data(), chunk_size, output)
+    except Exception as error:  # pylint: disable=broad-except
+        log.exception(u'Exporting %s failed', block.scope_ids.usage_id)
+        return unicode(error) or error.__class__.__name__
+    finally:
+        # Each thread has its own database connections; don't leave them open when the pool ends.
+        connections.close_all()
+    return None
+
+
+def write_course_archive(blocks, concurrency=COURSE_CONCURRENCY, progress=None, chunk_size=CHUNK_SIZE):
+    """
+    Export each (file name, block) in blocks to a CSV file, and return them zipped in a temporary file, rewound.
+
+    Up to concurrency blocks are exported at once, each in its own thread. The archive also has an index.csv
+    listing every block, and the error of any block that could not be exported. progress, if given, is called
+    with (number of blocks done, total number of blocks) after each block.
+    """
+    blocks = list(blocks)
+    directory = tempfile.mkdtemp()
+    pool = ThreadPool(max(1, min(concurrency, len(blocks))))
+    output = tempfile.TemporaryFile()
+    try:
+        tasks = [
+            (block, os.path.join(directory, '{}.csv'.format(index)), chunk_size)
+            for index, (__, block) in enumerate(blocks)
+        ]
+        index_rows = [['file', 'usage_id', 'display_name', 'error']]
+        with closing(zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)) as archive:
+            # imap() yields results in order, each as soon as it and those before it are done.
+            results = itertools.izip(blocks, tasks, pool.imap(export_block_file, tasks))
+            for done, ((name, block), (__, path, __), error) in enumerate(results, 1):
+                if error is None:
+                    archive.write(path, name)
+                    os.remove(path)
+                index_rows.append([name, unicode(block.scope_ids.usage_id), block.display_name, error or ''])
+                if progress is not None:
+                    progress(done, len(blocks))
+            index = write_csv(index_rows)
+            archive.writestr('index.csv', index.read())
+            index.close()
+    except Exception:
+        output.close()
+        raise
+    finally:
+        pool.terminate()
+        shutil.rmtree(directory)
+    output.seek(0)
+    return output
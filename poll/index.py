@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Precomputed lookups over the answers and questions fields.
+"""
+import copy
+import hashlib
+import json
+
+
+class ItemIndex(object):
+    """
+    Lookups over an answers or questions field, i.e. a list of (key, value) pairs.
+
+    Instances are shared by every block and request with the same field value, so they must never be
+    modified.
+    """
+    __slots__ = ('keys', 'key_set', 'positions', 'values', 'labels', 'fingerprint')
+
+    def __init__(self, items):
+        self.keys = tuple(key for key, __ in items)
+        self.key_set = frozenset(self.keys)
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.values = {key: copy.deepcopy(value) for key, value in items}
+        # Survey answers are plain labels; everything else is a dict with a label and an image.
+        self.labels = tuple(value['label'] if isinstance(value, dict) else value for __, value in items)
+        # Identifies the set of keys, whatever their order and labels.
+        self.fingerprint = hashlib.sha1(json.dumps(sorted(self.keys))).hexdigest()
+
+    def matches(self, items):
+        """
+        Return whether the index was built from a field value equal to items.
+        """
+        if len(items) != len(self.keys):
+            return False
+        return all(key == own_key and value == self.values[own_key] for (key, value), own_key in zip(items, self.keys))
+
+    def __contains__(self, key):
+        try:
+            return key in self.key_set
+        except TypeError:
+            # Unhashable values from request data are never valid keys.
+            return False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def label(self, key):
+        """
+        Return the label of the item with the given key.
+        """
+        return self.labels[self.positions[key]]
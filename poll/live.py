@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Notifications of changed vote counts, for live results.
+"""
+import threading
+import time
+
+from .cache import LRUCache
+
+
+class LocalBroker(object):
+    """
+    In-process publish/subscribe of each block's latest counts.
+
+    Every publish() bumps the topic's sequence number and wakes up the requests waiting on it. Only
+    requests served by the same process hear about each other's votes, so long-polling requests also
+    re-read shared counts at regular intervals to pick up votes recorded elsewhere.
+
+    Only the `maxsize` most recently used topics are kept. A request waiting on a topic that was dropped
+    wakes up with sequence number 0, and re-reads the counts.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.condition = threading.Condition()
+        self.topics = LRUCache(maxsize=maxsize)
+
+    def latest(self, topic):
+        """
+        Return (sequence number, counts) for the last message published on topic.
+        """
+        with self.condition:
+            return self.topics.get(topic, (0, None))
+
+    def publish(self, topic, tally):
+        """
+        Publish new counts on topic, waking up everyone waiting on it.
+        """
+        with self.condition:
+            seq = self.topics.get(topic, (0, None))[0] + 1
+            self.topics.set(topic, (seq, tally))
+            self.condition.notify_all()
+
+    def wait(self, topic, seq, timeout):
+        """
+        Wait up to timeout seconds for a message on topic newer than seq, and return latest(topic).
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.topics.get(topic, (0, None))[0] == seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return self.topics.get(topic, (0, None))
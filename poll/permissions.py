@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Cached decisions on which learners may view private results through XBLOCK_POLL_EXTRA_VIEW_GROUPS.
+
+Decisions are kept in the default Django cache for a limited time. Each one is stored with the
+current generation number, and any change to group memberships or group profiles bumps the
+generation, so every process stops using the older decisions straight away.
+"""
+import hashlib
+import json
+
+GENERATION_KEY = 'xblock-poll:view-groups:generation'
+KEY_PREFIX = 'xblock-poll:view-groups:'
+
+
+def get_cache():
+    """
+    Return the Django cache the decisions are kept in.
+    """
+    from django.core.cache import caches  # pylint: disable=import-error
+    return caches['default']
+
+
+def cached_decision(user_key, group_names, ttl, decide):
+    """
+    Return whether the user identified by user_key is in one of group_names, calling decide() on a miss.
+    """
+    cache = get_cache()
+    key = KEY_PREFIX + hashlib.sha1(json.dumps([user_key, sorted(group_names)])).hexdigest()
+    values = cache.get_many([GENERATION_KEY, key])
+    generation = values.get(GENERATION_KEY, 0)
+    cached = values.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    decision = bool(decide())
+    cache.set(key, (generation, decision), ttl)
+    return decision
+
+
+def invalidate(**kwargs):  # pylint: disable=unused-argument
+    """
+    Signal receiver: forget every cached decision.
+    """
+    cache = get_cache()
+    cache.add(GENERATION_KEY, 0, None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # The key was evicted between add() and incr().
+        cache.add(GENERATION_KEY, 1, None)
+
+
+def connect_signals(group_profile_model):
+    """
+    Invalidate the cached decisions whenever group memberships or group profiles change.
+    """
+    # pylint: disable=import-error
+    from django.contrib.auth.models import User
+    from django.db.models.signals import m2m_changed, post_delete, post_save
+
+    m2m_changed.connect(invalidate, sender=User.groups.through, dispatch_uid='xblock-poll-view-groups-members')
+    post_save.connect(invalidate, sender=group_profile_model, dispatch_uid='xblock-poll-view-groups-save')
+    post_delete.connect(invalidate, sender=group_profile_model, dispatch_uid='xblock-poll-view-groups-delete')
@@ -21,12 +21,14 @@
 # along with this program in a file in the toplevel directory called
 # "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
 #
-from collections import OrderedDict
-import functools
+from collections import OrderedDict, defaultdict
+import copy
+import hashlib
 import json
+import logging
+import math
 import time
 
-from markdown import markdown
 import pkg_resources
 from webob import Response
 
@@ -36,7 +38,11 @@ from xblock.fragment import Fragment
 from xblockutils.publish_event import PublishEventMixin
 from xblockutils.resources import ResourceLoader
 from xblockutils.settings import XBlockWithSettingsMixin, ThemableXBlockMixin
-from .utils import _
+from . import counters, export, permissions
+from .cache import LRUCache, MarkdownCache, SnapshotCache
+from .index import ItemIndex
+from .live import LocalBroker
+from .utils import _, django_setting
 
 
 try:
@@ -47,6 +53,8 @@ try:
     HAS_GROUP_PROFILE = True
 except ImportError:
     HAS_GROUP_PROFILE = False
+else:
+    permissions.connect_signals(GroupProfile)
 
 try:
     # pylint: disable=import-error
@@ -55,6 +63,26 @@ try:
 except ImportError:
     HAS_STATIC_REPLACE = False
 
+log = logging.getLogger(__name__)
+
+# Packaged templates, CSS and JS, and theme CSS keyed by (package, location), shared by every block rendered
+# in this process.
+RESOURCE_CACHE = LRUCache(maxsize=64)
+# Content fingerprints of the resources in RESOURCE_CACHE, keyed by path.
+FINGERPRINT_CACHE = LRUCache(maxsize=64)
+# Compiled Django templates, keyed by (template path, theme).
+TEMPLATE_CACHE = LRUCache(maxsize=32)
+# Rendered markdown for questions, answers and feedback, keyed by a hash of the source text.
+MARKDOWN_CACHE = MarkdownCache(maxsize=django_setting('XBLOCK_POLL_MARKDOWN_CACHE_SIZE', 2048))
+# Serialised get_results payloads, keyed by block and results version.
+RESULTS_CACHE = SnapshotCache(maxsize=django_setting('XBLOCK_POLL_RESULTS_CACHE_SIZE', 1024))
+# Lookups over answers and questions fields, keyed by field name and a hash of the field value.
+INDEX_CACHE = LRUCache(maxsize=512)
+# Latest counts of each block voted on in this process, for requests waiting on live results.
+RESULTS_BROKER = LocalBroker()
+# Recently seen counts, keyed by (block, tally version), so live results can send only what changed.
+TALLY_HISTORY = LRUCache(maxsize=256)
+
 
 class ResourceMixin(XBlockWithSettingsMixin, ThemableXBlockMixin):
     loader = ResourceLoader(__name__)
@@ -65,22 +93,131 @@ class ResourceMixin(XBlockWithSettingsMixin, ThemableXBlockMixin):
         'locations': ["public/css/themes/lms.css"]
     }
 
+    # Resources needed to render any poll or survey, loaded up front by preload_resources().
+    preloaded_resources = (
+        'public/html/poll.html',
+        'public/html/survey.html',
+        'public/html/poll_edit.html',
+        'public/css/poll.css',
+        'public/css/poll_edit.css',
+        'public/js/poll.js',
+        'public/js/poll_edit.js',
+        'public/js/templates.js',
+        'public/js/vendor/handlebars.runtime.js',
+    )
+
+    # The settings bucket as fetched from the settings service, once per block instance.
+    _xblock_settings = None
+    _xblock_settings_fetched = False
+
+    def get_xblock_settings(self, default=None):
+        """
+        Return the settings bucket, asking the settings service only the first time.
+
+        Blocks are loaded for each request, so this still sees settings changes on the next request.
+        """
+        if not self._xblock_settings_fetched:
+            self._xblock_settings = super(ResourceMixin, self).get_xblock_settings(default=None)
+            self._xblock_settings_fetched = True
+        if self._xblock_settings is None:
+            return default
+        return self._xblock_settings
+
     @staticmethod
-    def resource_string(path):
-        """Handy helper for getting resources from our kit."""
+    def load_resource(path):
+        """Read a resource from our kit, bypassing the resource cache."""
         data = pkg_resources.resource_string(__name__, path)
         return data.decode("utf8")
 
-    def create_fragment(self, context, template, css, js, js_init):
-        html = Template(
-            self.resource_string(template)).render(Context(context))
+    @classmethod
+    def preload_resources(cls):
+        """Warm the resource cache with everything needed to render a block."""
+        for path in cls.preloaded_resources:
+            RESOURCE_CACHE.set(path, cls.load_resource(path))
+
+    def resource_cache_enabled(self):
+        """
+        Whether packaged resources may be served from the process-wide cache.
+
+        Can be switched off with the CACHE_RESOURCES settings bucket key, e.g. in development.
+        """
+        return self.get_xblock_settings(default={}).get('CACHE_RESOURCES', True)
+
+    def resource_string(self, path):
+        """Handy helper for getting resources from our kit."""
+        path = path.lstrip('/')
+        if not self.resource_cache_enabled():
+            return self.load_resource(path)
+        return RESOURCE_CACHE.get_or_set(path, lambda: self.load_resource(path))
+
+    def static_assets_enabled(self):
+        """
+        Whether our CSS and JS are linked as cacheable static assets instead of inlined.
+
+        Enabled with the STATIC_ASSETS settings bucket key.
+        """
+        return self.get_xblock_settings(default={}).get('STATIC_ASSETS', False)
+
+    def static_resource_url(self, path):
+        """
+        Return a URL for one of our public resources, fingerprinted with a hash of its content.
+
+        local_resource_url() serves files under their packaged name, so the fingerprint goes in the
+        query string: the URL changes whenever the file does, and browsers can cache it indefinitely.
+        """
+        path = path.lstrip('/')
+
+        def fingerprint():
+            return hashlib.sha1(self.resource_string(path).encode('utf-8')).hexdigest()[:12]
+
+        if self.resource_cache_enabled():
+            version = FINGERPRINT_CACHE.get_or_set(path, fingerprint)
+        else:
+            version = fingerprint()
+        return u'{}?v={}'.format(self.runtime.local_resource_url(self, path), version)
+
+    def get_template(self, template):
+        """
+        Return the compiled Django template at the given resource path.
+
+        Templates are only parsed once per process and theme; rendering them is thread-safe.
+        """
+        if not self.resource_cache_enabled():
+            return Template(self.resource_string(template))
+        key = (template.lstrip('/'), json.dumps(self.get_theme(), sort_keys=True))
+        return TEMPLATE_CACHE.get_or_set(key, lambda: Template(self.resource_string(template)))
+
+    def include_theme_files(self, fragment):
+        """
+        Add the theme's CSS to the fragment, reading each file once per process.
+        """
+        theme = self.get_theme()
+        if not theme or 'package' not in theme:
+            return
+        for location in theme.get('locations', []):
+            fragment.add_css(self.theme_css(theme['package'], location))
+
+    def theme_css(self, package, location):
+        """
+        Return the theme CSS file at location in package.
+        """
+        if not self.resource_cache_enabled():
+            return ResourceLoader(package).load_unicode(location)
+        return RESOURCE_CACHE.get_or_set((package, location), lambda: ResourceLoader(package).load_unicode(location))
+
+    def create_fragment(self, context, template, css, js, js_init, js_data=None):
+        html = self.get_template(template).render(Context(context))
         frag = Fragment(html)
-        frag.add_javascript_url(
-            self.runtime.local_resource_url(
-                self, 'public/js/vendor/handlebars.js'))
-        frag.add_css(self.resource_string(css))
-        frag.add_javascript(self.resource_string(js))
-        frag.initialize_js(js_init)
+        # Handlebars templates are precompiled by scripts/precompile_templates.js, so only the runtime is needed.
+        frag.add_javascript_url(self.static_resource_url('public/js/vendor/handlebars.runtime.js'))
+        frag.add_javascript_url(self.static_resource_url('public/js/templates.js'))
+        if self.static_assets_enabled():
+            frag.add_css_url(self.static_resource_url(css))
+            frag.add_javascript_url(self.static_resource_url(js))
+        else:
+            frag.add_css(self.resource_string(css))
+            frag.add_javascript(self.resource_string(js))
+        frag.initialize_js(js_init, js_data)
         self.include_theme_files(frag)
         return frag
 
@@ -102,6 +239,19 @@ class CSVExportMixin(object):
         default=None,
         scope=Scope.user_state_summary,
     )
+    active_course_export_task_id = String(
+        # The UUID of the celery AsyncResult for the most recent export of every poll and survey in the course,
+        # if it has not finished yet.
+        default="",
+        scope=Scope.user_state_summary,
+    )
+    last_course_export_result = Dict(
+        # The info dict returned by the most recent course export, with an "error" key set if it failed.
+        default=None,
+        scope=Scope.user_state_summary,
+    )
+    # The key of each learner's vote in their state.
+    vote_key = None
 
     @XBlock.json_handler
     def csv_export(self, data, suffix=''):
@@ -115,6 +265,7 @@ class CSVExportMixin(object):
         async_result = export_csv_data.delay(
             unicode(getattr(self.scope_ids, 'usage_id', None)),
             unicode(getattr(self.runtime, 'course_id', 'course_id')),
+            (self.last_export_result or {}).get('snapshot'),
         )
         if not async_result.ready():
             self.active_export_task_id = async_result.id
@@ -149,18 +300,69 @@ class CSVExportMixin(object):
             if async_result.ready():
                 self._store_export_result(async_result)
 
+    @XBlock.json_handler
+    def course_csv_export(self, data, suffix=''):
+        """
+        Staff-only tool: asynchronously export every poll and survey in the course to a zip file of CSV files.
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            return {'success': False, 'errors': [self.ugettext('You do not have permission to do this.')]}
+        from .tasks import export_course_csv_data  # Import here since this is edX LMS specific
+
+        async_result = export_course_csv_data.delay(unicode(getattr(self.runtime, 'course_id', 'course_id')))
+        if not async_result.ready():
+            self.active_course_export_task_id = async_result.id
+        else:
+            self.active_course_export_task_id = ''
+            self.last_course_export_result = self._export_result(async_result)
+        return self._get_course_export_status()
+
+    @XBlock.json_handler
+    def get_course_export_status(self, data, suffix=''):
+        """
+        Staff-only tool: return the course export's pending status and progress, previous result, and the
+        download URL.
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            return {'success': False, 'errors': [self.ugettext('You do not have permission to do this.')]}
+        return self._get_course_export_status()
+
+    def _get_course_export_status(self):
+        from .tasks import export_course_csv_data  # Import here since this is edX LMS specific
+        progress = None
+        if self.active_course_export_task_id:
+            async_result = export_course_csv_data.AsyncResult(self.active_course_export_task_id)
+            if async_result.ready():
+                self.active_course_export_task_id = ''
+                self.last_course_export_result = self._export_result(async_result)
+            elif async_result.state == 'PROGRESS':
+                progress = async_result.info
+        return {
+            'success': True,
+            'export_pending': bool(self.active_course_export_task_id),
+            'progress': progress,
+            'last_export_result': self.last_course_export_result,
+            'download_url': self._report_url(self.last_course_export_result),
+        }
+
     @property
     def download_url_for_last_report(self):
         """ Get the URL for the last report, if any """
+        return self._report_url(self.last_export_result)
+
+    def _report_url(self, result):
+        """
+        Return the URL of the report stored by an export with the given result, if any.
+        """
         from lms.djangoapps.instructor_task.models import ReportStore  # pylint: disable=import-error
 
         # Unfortunately this is a bit inefficient due to the ReportStore API
-        if not self.last_export_result or self.last_export_result['error'] is not None:
+        if not result or result['error'] is not None:
             return None
 
         report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
         course_key = getattr(self.scope_ids.usage_id, 'course_key', None)
-        return dict(report_store.links_for(course_key)).get(self.last_export_result['report_filename'])
+        return dict(report_store.links_for(course_key)).get(result['report_filename'])
 
     def student_module_queryset(self):
         from courseware.models import StudentModule  # pylint: disable=import-error
@@ -169,20 +371,81 @@ class CSVExportMixin(object):
             module_state_key=self.scope_ids.usage_id,
         ).order_by('-modified')
 
+    def export_rows(self, since=None):
+        """
+        Yield (user id, username, email, state) for each learner with a StudentModule row for this block.
+
+        With since, a POSIX timestamp, only rows modified from then on are read. Usernames and emails come from a
+        join with the user table rather than a query per learner, and rows are read in batches of
+        XBLOCK_POLL_EXPORT_BATCH_SIZE.
+        """
+        queryset = self.student_module_queryset()
+        if since is not None:
+            queryset = queryset.filter(modified__gte=export.modified_since(since))
+        return export.keyset_batches(
+            queryset,
+            export.EXPORT_FIELDS,
+            django_setting('XBLOCK_POLL_EXPORT_BATCH_SIZE', export.BATCH_SIZE),
+        )
+
+    def export_votes(self, since=None, keep_empty=False):
+        """
+        Yield (user id, username, email, vote) for each learner with a vote stored under vote_key in their state.
+
+        States are decoded with XBLOCK_POLL_EXPORT_DECODER, see poll.export.get_decoder().
+        """
+        decoder = export.get_decoder(django_setting('XBLOCK_POLL_EXPORT_DECODER', 'auto'))
+        return export.votes(self.export_rows(since), self.vote_key, decoder, keep_empty)
+
+    def update_snapshot(self, snapshot, since=None):
+        """
+        Merge the votes of learners whose state changed since the timestamp since into snapshot, or those of every
+        learner if since is None. Returns the number of rows read.
+        """
+        return snapshot.merge(self.export_votes(since, keep_empty=since is not None))
+
     def _store_export_result(self, task_result):
-        """ Given an AsyncResult or EagerResult, save it. """
+        """
+        Given an AsyncResult or EagerResult, save it.
+
+        A failed export keeps the snapshot of the last good one, and once the result is saved every other snapshot
+        of this block is deleted.
+        """
         self.active_export_task_id = ''
+        result = self._export_result(task_result)
+        previous_snapshot = (self.last_export_result or {}).get('snapshot')
+        if result.get('error') and previous_snapshot:
+            result['snapshot'] = previous_snapshot
+        self.last_export_result = result
+        self._delete_stale_snapshots(result.get('snapshot'))
+
+    def _delete_stale_snapshots(self, snapshot):
+        """
+        Delete this block's export snapshots from the report storage, except the one described by snapshot.
+        """
+        from lms.djangoapps.instructor_task.models import ReportStore  # pylint: disable=import-error
+        storage = ReportStore.from_config(config_name='GRADES_DOWNLOAD').storage
+        try:
+            export.delete_stale_snapshots(storage, unicode(self.scope_ids.usage_id), (snapshot or {}).get('name'))
+        except Exception:  # pylint: disable=broad-except
+            # They are deleted again after the next export.
+            log.exception(u'Could not delete the old export snapshots of %s', self.scope_ids.usage_id)
+
+    @staticmethod
+    def _export_result(task_result):
+        """ Return the result to save for a finished AsyncResult or EagerResult. """
         if task_result.successful():
             if isinstance(task_result.result, dict) and not task_result.result.get('error'):
-                self.last_export_result = task_result.result
-            else:
-                self.last_export_result = {'error': u'Unexpected result: {}'.format(repr(task_result.result))}
-        else:
-            self.last_export_result = {'error': unicode(task_result.result)}
+                return task_result.result
+            return {'error': u'Unexpected result: {}'.format(repr(task_result.result))}
+        return {'error': unicode(task_result.result)}
 
-    def prepare_data(self):
+    def prepare_data(self, votes=None):
         """
-        Return a two-dimensional list containing cells of data ready for CSV export.
+        Yield the header row, then a list of cells ready for CSV export for each (user id, username, email, vote)
+        in votes, by default every learner who answered.
+
+        Rows are produced as they are read from the database, so exports of any size run in bounded memory.
         """
         raise NotImplementedError
 
@@ -202,12 +465,25 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
     has_author_view = True
 
     event_namespace = 'xblock.pollbase'
+    # Memo of can_view_private_results() for the current request, as (user id, answer): the block can be
+    # rebound to another user, e.g. when staff masquerade as a learner.
+    _can_view_private_results = None
+    # Memo of item_index() for this block instance, keyed by field name.
+    _item_indexes = None
     private_results = Boolean(default=False, help=_("Whether or not to display results to the user."))
     max_submissions = Integer(default=1, help=_("The maximum number of times a user may send a submission."))
     submissions_count = Integer(
         default=0, help=_("Number of times the user has sent a submission."), scope=Scope.user_state
     )
     feedback = String(default='', help=_("Text to display after the user votes."))
+    rendered_markdown = Dict(
+        default=None, scope=Scope.settings,
+        help=_("HTML rendered from the markdown fields when the block was last saved in Studio.")
+    )
+    tally_schema = String(
+        default=None, scope=Scope.user_state_summary,
+        help=_("Fingerprint of the answers and questions the tally was last cleaned for.")
+    )
 
     def send_vote_event(self, choice_data):
         # Let the LMS know the user has answered the poll.
@@ -227,13 +503,63 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
         """
         return any(value['img'] for key, value in field)
 
-    @staticmethod
-    def markdown_items(items):
+    def render_markdown(self, text):
+        """
+        Render markdown text as HTML through the shared markdown cache.
+
+        If the MARKDOWN_CACHE settings bucket key names a Django cache, rendered HTML is also shared
+        through it between processes.
+        """
+        shared_cache = None
+        cache_alias = self.get_xblock_settings(default={}).get('MARKDOWN_CACHE')
+        if cache_alias:
+            from django.core.cache import caches  # pylint: disable=import-error
+            shared_cache = caches[cache_alias]
+        return MARKDOWN_CACHE.render(text, shared_cache=shared_cache)
+
+    def markdown_sources(self):
+        """
+        Return the markdown source of every field shown as HTML, as {name: text} or {name: {key: label}}.
+        """
+        raise NotImplementedError
+
+    def render_markdown_fields(self):
+        """
+        Render markdown_sources() as HTML, keeping its shape and tagging it with a hash of the sources.
+        """
+        sources = self.markdown_sources()
+        rendered = {'source_hash': hashlib.sha1(json.dumps(sources, sort_keys=True)).hexdigest()}
+        for name, source in sources.items():
+            if isinstance(source, dict):
+                rendered[name] = {key: self.render_markdown(label) for key, label in source.items()}
+            else:
+                rendered[name] = self.render_markdown(source)
+        return rendered
+
+    def rendered_markdown_fields(self):
+        """
+        Return the HTML for all markdown fields, as stored by studio_submit.
+
+        Blocks saved before the HTML was stored, or changed without going through studio_submit (e.g.
+        by an OLX import), are rendered on the fly through the markdown cache instead. Settings fields
+        are read-only in the LMS, so that result is not saved back.
         """
-        Convert all items' labels into markdown.
+        stored = self.rendered_markdown
+        if stored:
+            source_hash = hashlib.sha1(json.dumps(self.markdown_sources(), sort_keys=True)).hexdigest()
+            if stored.get('source_hash') == source_hash:
+                return stored
+        return self.render_markdown_fields()
+
+    def rendered_items(self, field, rendered=None):
+        """
+        Return the items of the given answers/questions field with their labels rendered as HTML.
         """
-        return [(key, {'label': markdown(value['label']), 'img': value['img'], 'img_alt': value.get('img_alt')})
-                for key, value in items]
+        labels = (rendered or self.rendered_markdown_fields())[field]
+        return [
+            (key, {'label': labels[key], 'img': value['img'], 'img_alt': value.get('img_alt')})
+            for key, value in getattr(self, field)
+        ]
 
     def _get_block_id(self):
         """
@@ -252,11 +578,7 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
         """
         Determine whether alt attributes for images are configured to be mandatory.  Defaults to True.
         """
-        settings_service = self.runtime.service(self, "settings")
-        if not settings_service:
-            return True
-        xblock_settings = settings_service.get_settings_bucket(self)
-        return xblock_settings.get('IMG_ALT_MANDATORY', True)
+        return self.get_xblock_settings(default={}).get('IMG_ALT_MANDATORY', True)
 
     def gather_items(self, data, result, noun, field, image=True):
         """
@@ -339,6 +661,279 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
 
         return items
 
+    def item_index(self, field):
+        """
+        Return the ItemIndex of the answers or questions field, shared by every block with the same value.
+
+        The index is remembered on the block, so the field is only hashed again if its value changes.
+        """
+        items = getattr(self, field)
+        if self._item_indexes is None:
+            self._item_indexes = {}
+        index = self._item_indexes.get(field)
+        if index is None or not index.matches(items):
+            key = (field, hashlib.sha1(json.dumps(items, sort_keys=True)).hexdigest())
+            index = self._item_indexes[field] = INDEX_CACHE.get_or_set(key, lambda: ItemIndex(items))
+        return index
+
+    def counter_backend(self):
+        """
+        Return the backend that records votes, as selected by the COUNTER_BACKEND settings bucket key.
+        """
+        return counters.get_backend(self.get_xblock_settings(default={}))
+
+    def tally_schema_key(self):
+        """
+        Return a fingerprint of the keys that clean_tally() makes the tally match.
+        """
+        raise NotImplementedError
+
+    def clean_tally_if_changed(self):
+        """
+        Clean the tally, unless the answers and questions are the same as the last time it was cleaned.
+
+        This keeps views that only read the results from writing to the tally.
+        """
+        schema = self.tally_schema_key()
+        if self.tally_schema != schema:
+            self.clean_tally()
+            self.tally_schema = schema
+
+    def current_tally(self):
+        """
+        Return the cleaned tally, with up to date counts from the counter backend.
+        """
+        self.clean_tally_if_changed()
+        return self.counter_backend().tally(self)
+
+    @XBlock.json_handler
+    def fold_tally_shards(self, data, suffix=''):
+        """
+        Staff-only tool: copy the vote counts kept by the counter backend (summed over all shards)
+        into the tally field.
+        """
+        if not getattr(self.runtime, 'user_is_staff', False):
+            return {'success': False, 'errors': [self.ugettext('You do not have permission to do this.')]}
+        self.clean_tally_if_changed()
+        return {'success': True, 'errors': [], 'tally': self.counter_backend().fold(self)}
+
+    def results_settings(self):
+        """
+        Return the settings that the results payload is built from.
+        """
+        raise NotImplementedError
+
+    def results_choice(self):
+        """
+        Return the current learner's answers, as shown in the results payload.
+        """
+        raise NotImplementedError
+
+    def results_data(self, source_tally):
+        """
+        Return the results payload, for the given tally or with the results hidden if it is None.
+        """
+        raise NotImplementedError
+
+    def static_replace(self, text):
+        """
+        Replace static pseudo-URLs in text by the actual paths, where the LMS supports it.
+        """
+        if HAS_STATIC_REPLACE:
+            return replace_static_urls(text, course_id=self.runtime.course_id)
+        return text
+
+    @staticmethod
+    def json_response(request, body, etag):
+        """
+        Return the JSON body tagged with etag, or an empty 304 response if the client's If-None-Match has it.
+        """
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(body, content_type='application/json', charset='utf8')
+        response.etag = etag
+        # The payload depends on the learner, and must be revalidated before reuse.
+        response.cache_control = 'private, no-cache'
+        return response
+
+    def prepare_results(self):
+        """
+        Record that the learner is viewing the results, and return (version, source tally) for results_body().
+
+        The version is a hash of the counts and settings the results are built from, plus the learner's own
+        answers. The source tally is None if the learner may not see the counts.
+        """
+        if self.private_results and not self.can_view_private_results():
+            source_tally, choice = None, None
+        else:
+            self.publish_event_from_dict(self.event_namespace + '.view_results', {})
+            source_tally, choice = self.current_tally(), self.results_choice()
+        version = hashlib.sha1(json.dumps([source_tally, choice, self.results_settings()], sort_keys=True)).hexdigest()
+        return version, source_tally
+
+    def results_body(self, version, source_tally):
+        """
+        Return the serialised results payload.
+
+        Payloads are cached in RESULTS_CACHE under their version, so each one is only built once per
+        process. The CACHE_RESULTS settings bucket key can turn this off.
+        """
+        def build():
+            payload = self.results_data(source_tally)
+            if source_tally is not None:
+                # The cursor for watch_results.
+                payload['tally_version'] = counters.tally_version(source_tally)
+                TALLY_HISTORY.set((unicode(self.scope_ids.usage_id), payload['tally_version']), source_tally)
+            # Static URL replacement is a regex over the whole payload, so cache its result too.
+            return self.static_replace(json.dumps(payload))
+
+        if not self.get_xblock_settings(default={}).get('CACHE_RESULTS', True):
+            body = build()
+        else:
+            body = RESULTS_CACHE.get_or_build((unicode(self.scope_ids.usage_id), version), build)
+        return body
+
+    def results_response(self, request):
+        """
+        Return the results payload for the get_results handler, tagged with its version as an ETag so that
+        clients that already have it get a 304.
+        """
+        version, source_tally = self.prepare_results()
+        if version in request.if_none_match:
+            return self.json_response(request, None, version)
+        return self.json_response(request, self.results_body(version, source_tally), version)
+
+    def initial_js_data(self, voted):
+        """
+        Return what poll.js needs to show the block on page load, so it does not have to ask for it.
+
+        Learners who voted on a poll with public results also get the results, as get_results would return
+        them, along with their ETag.
+        """
+        data = {'voted': voted, 'private_results': self.private_results}
+        if voted and not self.private_results:
+            version, source_tally = self.prepare_results()
+            data['results'] = json.loads(self.results_body(version, source_tally))
+            data['results_etag'] = '"{}"'.format(version)
+        return data
+
+    def tally_paths(self):
+        """
+        Return the path of every count in the tally, in the order used by the compact encoding.
+        """
+        raise NotImplementedError
+
+    def user_state_response(self, request, user_state):
+        """
+        Return the student_view_user_state response: the learner's state (their answers and submission
+        count) with the current counts, and a version to sync from next time.
+
+        With a `since` query parameter holding a version returned earlier, only the counts that changed
+        are sent, as [path, count] pairs, along with whether the learner's own state changed (and if so,
+        that state). If the counts at that version are no longer known, everything is sent. With
+        `encoding=compact`, counts are sent as a list in tally_paths() order, and changes as
+        [index, count] pairs.
+        """
+        tally = self.current_tally()
+        topic = unicode(self.scope_ids.usage_id)
+        tally_version = counters.tally_version(tally)
+        TALLY_HISTORY.set((topic, tally_version), copy.deepcopy(tally))
+        state_version = hashlib.sha1(json.dumps(user_state, sort_keys=True)).hexdigest()[:12]
+        compact = request.GET.get('encoding') == 'compact'
+        since_tally_version, __, since_state_version = request.GET.get('since', '').partition('.')
+        previous = TALLY_HISTORY.get((topic, since_tally_version)) if since_tally_version else None
+
+        response = {'version': '{}.{}'.format(tally_version, state_version)}
+        if previous is None:
+            response.update(user_state)
+            if compact:
+                response['counts'] = [counters.get_count(tally, path) for path in self.tally_paths()]
+            else:
+                response['tally'] = tally
+        else:
+            changes = counters.changed_counts(previous, tally)
+            if compact:
+                index = {path: position for position, path in enumerate(self.tally_paths())}
+                changes = [[index[tuple(path)], count] for path, count in changes if tuple(path) in index]
+            response['changes'] = changes
+            response['state_changed'] = since_state_version != state_version
+            if response['state_changed']:
+                response.update(user_state)
+
+        body = json.dumps(response)
+        return self.json_response(request, body, hashlib.sha1(body).hexdigest())
+
+    def live_results_enabled(self):
+        """
+        Whether the results shown to learners follow new votes, as set by the LIVE_RESULTS settings bucket key.
+        """
+        return bool(self.get_xblock_settings(default={}).get('LIVE_RESULTS', False))
+
+    def publish_tally(self):
+        """
+        Let requests waiting in watch_results know that the counts have changed, if live results are on.
+        """
+        if not self.live_results_enabled():
+            return
+        RESULTS_BROKER.publish(unicode(self.scope_ids.usage_id), copy.deepcopy(self.counter_backend().tally(self)))
+
+    @XBlock.handler
+    def watch_results(self, request, suffix=''):
+        """
+        Long-poll for changes to the vote counts.
+
+        Waits up to `timeout` seconds (capped by LIVE_RESULTS_TIMEOUT) until the counts no longer match
+        the `since` tally version, then returns the new version with either the changed counts, as
+        [path, count] pairs, or the whole tally if the counts at `since` are no longer known. Votes made
+        in this process are seen straight away; with a shared counter backend, votes made elsewhere are
+        picked up every LIVE_RESULTS_POLL_INTERVAL seconds.
+        """
+        if not self.live_results_enabled() or (self.private_results and not self.can_view_private_results()):
+            return Response(json.dumps({'live': False}), content_type='application/json', charset='utf8')
+
+        xblock_settings = self.get_xblock_settings(default={})
+        try:
+            timeout = float(request.GET.get('timeout', 25))
+        except ValueError:
+            timeout = 0
+        if math.isnan(timeout) or math.isinf(timeout):
+            # NaN slips through min() and max(), and would never time out.
+            timeout = 0
+        timeout = max(min(timeout, float(xblock_settings.get('LIVE_RESULTS_TIMEOUT', 25))), 0)
+        interval = float(xblock_settings.get('LIVE_RESULTS_POLL_INTERVAL', 1.0))
+        since = request.GET.get('since')
+        topic = unicode(self.scope_ids.usage_id)
+
+        self.clean_tally_if_changed()
+        backend = self.counter_backend()
+        start_seq = seq = RESULTS_BROKER.latest(topic)[0]
+        published = None
+        deadline = time.time() + timeout
+        while True:
+            if published is not None and not backend.shared:
+                # This request's copy of the tally field is out of date.
+                tally = published
+            else:
+                tally = backend.tally(self)
+            version = counters.tally_version(tally)
+            remaining = deadline - time.time()
+            if version != since or remaining <= 0:
+                break
+            seq, latest = RESULTS_BROKER.wait(topic, seq, min(interval, remaining) if backend.shared else remaining)
+            if seq != start_seq:
+                published = latest
+
+        payload = {'live': True, 'version': version, 'changed': version != since}
+        if version != since:
+            previous = TALLY_HISTORY.get((topic, since)) if since else None
+            if previous is not None:
+                payload['changes'] = counters.changed_counts(previous, tally)
+            else:
+                payload['tally'] = tally
+            TALLY_HISTORY.set((topic, version), copy.deepcopy(tally))
+        return Response(json.dumps(payload), content_type='application/json', charset='utf8')
+
     def can_vote(self):
         """
         Checks to see if the user is permitted to vote. This may not be the case if they used up their max_submissions.
@@ -349,6 +944,19 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
         """
         Checks to see if the user has permissions to view private results.
         This only works inside the LMS.
+
+        The answer is remembered for the rest of the request, as long as the block stays bound to the same user.
+        Group lookups are also cached between requests for PERMISSION_CACHE_TTL seconds (set in the settings
+        bucket, default 300; 0 turns this off).
+        """
+        user_id = self.scope_ids.user_id
+        if self._can_view_private_results is None or self._can_view_private_results[0] != user_id:
+            self._can_view_private_results = (user_id, self._check_can_view_private_results())
+        return self._can_view_private_results[1]
+
+    def _check_can_view_private_results(self):
+        """
+        Work out whether the user may view private results.
         """
         if not hasattr(self.runtime, 'user_is_staff'):
             return False
@@ -364,9 +972,16 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
         group_names = getattr(settings, 'XBLOCK_POLL_EXTRA_VIEW_GROUPS', [])
         if not group_names:
             return False
-        user = self.runtime.get_real_user(self.runtime.anonymous_student_id)
-        group_ids = user.groups.values_list('id', flat=True)
-        return GroupProfile.objects.filter(group_id__in=group_ids, name__in=group_names).exists()
+
+        def in_view_groups():
+            user = self.runtime.get_real_user(self.runtime.anonymous_student_id)
+            group_ids = user.groups.values_list('id', flat=True)
+            return GroupProfile.objects.filter(group_id__in=group_ids, name__in=group_names).exists()
+
+        ttl = int(self.get_xblock_settings(default={}).get('PERMISSION_CACHE_TTL', 300))
+        if ttl <= 0:
+            return in_view_groups()
+        return permissions.cached_decision(self.runtime.anonymous_student_id, group_names, ttl, in_view_groups)
 
     @staticmethod
     def get_max_submissions(ugettext, data, result, private_results):
@@ -388,30 +1003,6 @@ class PollBase(XBlock, ResourceMixin, PublishEventMixin):
             result['errors'].append(ugettext("Private results may not be False when Maximum Submissions is not 1."))
         return max_submissions
 
-    @classmethod
-    def static_replace_json_handler(cls, func):
-        """A JSON handler that replace all static pseudo-URLs by the actual paths.
-
-        The object returned by func is JSON-serialised, and the resulting string is passed to
-        replace_static_urls() to perform regex-based URL replacing.
-
-        We would prefer to explicitly call an API function on single image URLs, but such a function
-        is not exposed by the LMS API, so we have to fall back to this slightly hacky implementation.
-        """
-
-        @cls.json_handler
-        @functools.wraps(func)
-        def wrapper(self, request_json, suffix=''):
-            response = json.dumps(func(self, request_json, suffix))
-            response = replace_static_urls(response, course_id=self.runtime.course_id)
-            return Response(response, content_type='application/json')
-
-        if HAS_STATIC_REPLACE:
-            # Only use URL translation if it is available
-            return wrapper
-        # Otherwise fall back to a standard JSON handler
-        return cls.json_handler(func)
-
 
 class PollBlock(PollBase, CSVExportMixin):
     """
@@ -438,6 +1029,7 @@ class PollBlock(PollBase, CSVExportMixin):
                  help=_("Total tally of answers from students."))
     choice = String(scope=Scope.user_state, help=_("The student's answer"))
     event_namespace = 'xblock.poll'
+    vote_key = 'choice'
 
     def clean_tally(self):
         """
@@ -446,26 +1038,49 @@ class PollBlock(PollBase, CSVExportMixin):
         we just clean it up on first access within the LMS, in case the studio
         has made changes to the answers.
         """
-        answers = dict(self.answers)
-        for key in answers:
-            if key not in self.tally:
-                self.tally[key] = 0
+        answers = self.item_index('answers')
+        tally = self.tally
+        for key in answers.keys:
+            if key not in tally:
+                tally[key] = 0
 
-        for key in self.tally.keys():
+        for key in tally.keys():
             if key not in answers:
-                del self.tally[key]
+                del tally[key]
 
-    def tally_detail(self):
+    def tally_schema_key(self):
+        return self.item_index('answers').fingerprint
+
+    def tally_paths(self):
+        return [(key,) for key in self.item_index('answers').keys]
+
+    def blank_tally(self):
+        """
+        Return a tally with a zero count for every answer.
+        """
+        return dict.fromkeys(self.item_index('answers').keys, 0)
+
+    def stored_user_state(self, state):
+        """
+        Return the choice and submission count from a learner's raw stored state, as student_view_user_state would.
+        """
+        choice = state.get('choice')
+        return {
+            'choice': choice if choice in self.item_index('answers') else None,
+            'submissions_count': state.get('submissions_count', 0),
+        }
+
+    def tally_detail(self, source_tally=None):
         """
         Return a detailed dictionary from the stored tally that the
         Handlebars template can use.
         """
         tally = []
-        answers = OrderedDict(self.markdown_items(self.answers))
+        answers = OrderedDict(self.rendered_items('answers'))
         choice = self.get_choice()
         total = 0
-        self.clean_tally()
-        source_tally = self.tally
+        if source_tally is None:
+            source_tally = self.current_tally()
         for key, value in answers.items():
             count = int(source_tally[key])
             tally.append({
@@ -503,7 +1118,7 @@ class PollBlock(PollBase, CSVExportMixin):
         the student answered the poll. We don't want to take away
         the user's progress, but they should be able to vote again.
         """
-        if self.choice and self.choice in dict(self.answers):
+        if self.choice and self.choice in self.item_index('answers'):
             return self.choice
 
         return None
@@ -523,36 +1138,30 @@ class PollBlock(PollBase, CSVExportMixin):
         """
         if not context:
             context = {}
-        js_template = self.resource_string(
-            '/public/handlebars/poll_results.handlebars')
-
         choice = self.get_choice()
+        rendered = self.rendered_markdown_fields()
 
         context.update({
             'choice': choice,
-            'answers': self.markdown_items(self.answers),
-            'question': markdown(self.question),
+            'answers': self.rendered_items('answers', rendered),
+            'question': rendered['question'],
             'private_results': self.private_results,
             # Mustache is treating an empty string as true.
-            'feedback': markdown(self.feedback) or False,
-            'js_template': js_template,
+            'feedback': rendered['feedback'] or False,
             'any_img': self.any_image(self.answers),
             'display_name': self.display_name,
             'can_vote': self.can_vote(),
             'max_submissions': self.max_submissions,
             'submissions_count': self.submissions_count,
             'can_view_private_results': self.can_view_private_results(),
+            'live_results': self.live_results_enabled(),
             # a11y: Transfer block ID to enable creating unique ids for questions and answers in the template
             'block_id': self._get_block_id(),
         })
 
-        if self.choice:
-            detail, total = self.tally_detail()
-            context.update({'tally': detail, 'total': total, 'plural': total > 1})
-
         return self.create_fragment(
             context, "public/html/poll.html", "public/css/poll.css",
-            "public/js/poll.js", "PollBlock")
+            "public/js/poll.js", "PollBlock", self.initial_js_data(choice is not None))
 
     def student_view_data(self, context=None):
         """
@@ -572,29 +1181,20 @@ class PollBlock(PollBase, CSVExportMixin):
         """
         Returns a JSON representation of the student data for Poll Xblock
         """
-        response = {
+        return self.user_state_response(data, {
             'choice': self.get_choice(),
-            'tally': self.tally,
             'submissions_count': self.submissions_count,
-        }
-
-        return Response(
-            json.dumps(response),
-            content_type='application/json',
-            charset='utf8'
-        )
+        })
 
     def studio_view(self, context=None):
         if not context:
             context = {}
 
-        js_template = self.resource_string('/public/handlebars/poll_studio.handlebars')
         context.update({
             'question': self.question,
             'display_name': self.display_name,
             'private_results': self.private_results,
             'feedback': self.feedback,
-            'js_template': js_template,
             'max_submissions': self.max_submissions,
         })
         return self.create_fragment(
@@ -613,18 +1213,27 @@ class PollBlock(PollBase, CSVExportMixin):
             ],
         }
 
-    @PollBase.static_replace_json_handler
-    def get_results(self, data, suffix=''):
-        if self.private_results and not self.can_view_private_results():
+    @XBlock.handler
+    def get_results(self, request, suffix=''):
+        return self.results_response(request)
+
+    def results_settings(self):
+        return [self.question, self.feedback, self.answers, self.display_name]
+
+    def results_choice(self):
+        return self.get_choice()
+
+    def results_data(self, source_tally):
+        if source_tally is None:
             detail, total = {}, None
         else:
-            self.publish_event_from_dict(self.event_namespace + '.view_results', {})
-            detail, total = self.tally_detail()
+            detail, total = self.tally_detail(source_tally)
+        rendered = self.rendered_markdown_fields()
         return {
-            'question': markdown(self.question),
+            'question': rendered['question'],
             'tally': detail,
             'total': total,
-            'feedback': markdown(self.feedback),
+            'feedback': rendered['feedback'],
             'plural': total > 1,
             'display_name': self.display_name,
             'any_img': self.any_image(self.answers),
@@ -647,10 +1256,7 @@ class PollBlock(PollBase, CSVExportMixin):
         except KeyError:
             result['errors'].append(self.ugettext('Answer not included with request.'))
             return result
-        # Just to show data coming in...
-        try:
-            OrderedDict(self.answers)[choice]
-        except KeyError:
+        if choice not in self.item_index('answers'):
             result['errors'].append(
                 self.ugettext(
                     # Translators: {choice} uniquely identifies a specific answer belonging to a poll or survey.
@@ -666,19 +1272,23 @@ class PollBlock(PollBase, CSVExportMixin):
             result['errors'].append(self.ugettext('You have already voted as many times as you are allowed.'))
             return result
 
-        self.clean_tally()
+        self.clean_tally_if_changed()
+        deltas = defaultdict(int)
         if old_choice is not None:
-            self.tally[old_choice] -= 1
+            deltas[(old_choice,)] -= 1
+        deltas[(choice,)] += 1
+        self.counter_backend().update(self, deltas)
+        self.publish_tally()
+        submissions_count = self.submissions_count + 1
         self.choice = choice
-        self.tally[choice] += 1
-        self.submissions_count += 1
+        self.submissions_count = submissions_count
 
         result['success'] = True
         result['can_vote'] = self.can_vote()
-        result['submissions_count'] = self.submissions_count
+        result['submissions_count'] = submissions_count
         result['max_submissions'] = self.max_submissions
 
-        self.send_vote_event({'choice': self.choice})
+        self.send_vote_event({'choice': choice})
 
         return result
 
@@ -707,6 +1317,7 @@ class PollBlock(PollBase, CSVExportMixin):
         self.private_results = private_results
         self.display_name = display_name
         self.max_submissions = max_submissions
+        self.rendered_markdown = self.render_markdown_fields()
 
         # Tally will not be updated until the next attempt to use it, per
         # scoping limitations.
@@ -742,24 +1353,31 @@ class PollBlock(PollBase, CSVExportMixin):
              """),
         ]
 
+    def markdown_sources(self):
+        return {
+            'question': self.question,
+            'feedback': self.feedback,
+            'answers': {key: value['label'] for key, value in self.answers},
+        }
+
     def get_filename(self):
         return u"poll-data-export-{}.csv".format(time.strftime("%Y-%m-%d-%H%M%S", time.gmtime(time.time())))
 
-    def prepare_data(self):
-        header_row = ['user_id', 'username', 'user_email', 'question', 'answer']
-        data = {}
-        answers_dict = dict(self.answers)
-        for sm in self.student_module_queryset():
-            choice = json.loads(sm.state)['choice']
-            if sm.student.id not in data:
-                data[sm.student.id] = [
-                    sm.student.id,
-                    sm.student.username,
-                    sm.student.email,
-                    self.question,
-                    answers_dict[choice]['label'],
-                ]
-        return [header_row] + data.values()
+    def prepare_data(self, votes=None):
+        yield ['user_id', 'username', 'user_email', 'question', 'answer']
+        question = self.question
+        answers = self.item_index('answers')
+        if votes is None:
+            # There is one StudentModule row per learner and block, so rows need no de-duplication.
+            votes = self.export_votes()
+        for user_id, username, email, choice in votes:
+            yield [
+                user_id,
+                username,
+                email,
+                question,
+                answers.label(choice),
+            ]
 
 
 class SurveyBlock(PollBase, CSVExportMixin):
@@ -796,6 +1414,7 @@ class SurveyBlock(PollBase, CSVExportMixin):
     )
     choices = Dict(help=_("The user's answers"), scope=Scope.user_state)
     event_namespace = 'xblock.survey'
+    vote_key = 'choices'
 
     def author_view(self, context=None):
         """
@@ -813,33 +1432,31 @@ class SurveyBlock(PollBase, CSVExportMixin):
         if not context:
             context = {}
 
-        js_template = self.resource_string(
-            '/public/handlebars/survey_results.handlebars')
-
         choices = self.get_choices()
+        rendered = self.rendered_markdown_fields()
 
         context.update({
             'choices': choices,
             # Offset so choices will always be True.
             'answers': self.answers,
-            'js_template': js_template,
-            'questions': self.renderable_answers(self.questions, choices),
+            'questions': self.renderable_answers(choices, rendered),
             'private_results': self.private_results,
             'any_img': self.any_image(self.questions),
             # Mustache is treating an empty string as true.
-            'feedback': markdown(self.feedback) or False,
+            'feedback': rendered['feedback'] or False,
             'block_name': self.block_name,
             'can_vote': self.can_vote(),
             'submissions_count': self.submissions_count,
             'max_submissions': self.max_submissions,
             'can_view_private_results': self.can_view_private_results(),
+            'live_results': self.live_results_enabled(),
             # a11y: Transfer block ID to enable creating unique ids for questions and answers in the template
             'block_id': self._get_block_id(),
         })
 
         return self.create_fragment(
             context, "public/html/survey.html", "public/css/poll.css",
-            "public/js/poll.js", "SurveyBlock")
+            "public/js/poll.js", "SurveyBlock", self.initial_js_data(choices is not None))
 
     def student_view_data(self, context=None):
         """
@@ -860,25 +1477,18 @@ class SurveyBlock(PollBase, CSVExportMixin):
         """
         Returns a JSON representation of the student data for Survey Xblock
         """
-        response = {
+        return self.user_state_response(data, {
             'choices': self.get_choices(),
-            'tally': self.tally,
             'submissions_count': self.submissions_count,
-        }
-
-        return Response(
-            json.dumps(response),
-            content_type='application/json',
-            charset='utf8'
-        )
+        })
 
-    def renderable_answers(self, questions, choices):
+    def renderable_answers(self, choices, rendered=None):
         """
         Render markdown for questions, and annotate with answers
         in the case of private_results.
         """
         choices = choices or {}
-        markdown_questions = self.markdown_items(questions)
+        markdown_questions = self.rendered_items('questions', rendered)
         for key, value in markdown_questions:
             value['choice'] = choices.get(key, None)
         return markdown_questions
@@ -887,12 +1497,10 @@ class SurveyBlock(PollBase, CSVExportMixin):
         if not context:
             context = {}
 
-        js_template = self.resource_string('/public/handlebars/poll_studio.handlebars')
         context.update({
             'feedback': self.feedback,
             'display_name': self.block_name,
             'private_results': self.private_results,
-            'js_template': js_template,
             'max_submissions': self.max_submissions,
             'multiquestion': True,
         })
@@ -900,18 +1508,18 @@ class SurveyBlock(PollBase, CSVExportMixin):
             context, "public/html/poll_edit.html",
             "/public/css/poll_edit.css", "public/js/poll_edit.js", "SurveyEdit")
 
-    def tally_detail(self):
+    def tally_detail(self, source_tally=None):
         """
         Return a detailed dictionary from the stored tally that the
         Handlebars template can use.
         """
         tally = []
-        questions = OrderedDict(self.markdown_items(self.questions))
-        default_answers = OrderedDict([(answer, 0) for answer, __ in self.answers])
+        questions = OrderedDict(self.rendered_items('questions'))
+        default_answers = OrderedDict.fromkeys(self.item_index('answers').keys, 0)
         choices = self.choices or {}
         total = 0
-        self.clean_tally()
-        source_tally = self.tally
+        if source_tally is None:
+            source_tally = self.current_tally()
 
         # The result should always be the same-- just grab the first one.
         for key, value in source_tally.items():
@@ -962,25 +1570,62 @@ class SurveyBlock(PollBase, CSVExportMixin):
         we just clean it up on first access within the LMS, in case the studio
         has made changes to the answers.
         """
-        questions = dict(self.questions)
-        answers = dict(self.answers)
-        default_answers = {answer: 0 for answer in answers.keys()}
-        for key in questions.keys():
-            if key not in self.tally:
-                self.tally[key] = dict(default_answers)
+        questions = self.item_index('questions')
+        default_answers = dict.fromkeys(self.item_index('answers').keys, 0)
+        tally = self.tally
+        for key in questions.keys:
+            if key not in tally:
+                tally[key] = dict(default_answers)
             else:
                 # Answers may have changed, requiring an update for each
                 # question.
                 new_answers = dict(default_answers)
-                new_answers.update(self.tally[key])
-                for existing_key in self.tally[key]:
+                new_answers.update(tally[key])
+                for existing_key in tally[key]:
                     if existing_key not in default_answers:
                         del new_answers[existing_key]
-                self.tally[key] = new_answers
+                tally[key] = new_answers
         # Keys for questions that no longer exist can break calculations.
-        for key in self.tally.keys():
+        for key in tally.keys():
             if key not in questions:
-                del self.tally[key]
+                del tally[key]
+
+    def tally_schema_key(self):
+        return hashlib.sha1(
+            self.item_index('questions').fingerprint + self.item_index('answers').fingerprint
+        ).hexdigest()
+
+    def tally_paths(self):
+        answers = self.item_index('answers').keys
+        return [(question, answer) for question in self.item_index('questions').keys for answer in answers]
+
+    def blank_tally(self):
+        """
+        Return a tally with a zero count for every answer to every question.
+        """
+        answers = self.item_index('answers').keys
+        return {question: dict.fromkeys(answers, 0) for question in self.item_index('questions').keys}
+
+    def valid_choices(self, choices):
+        """
+        Whether choices answers exactly the current questions, with current answers.
+        """
+        answers = self.item_index('answers')
+        return (
+            frozenset(choices) == self.item_index('questions').key_set and
+            all(value in answers for value in choices.values())
+        )
+
+    def stored_user_state(self, state):
+        """
+        Return the choices and submission count from a learner's raw stored state, as student_view_user_state would.
+
+        Unlike get_choices(), outdated choices are not removed, just left out.
+        """
+        choices = state.get('choices')
+        if choices is not None and not self.valid_choices(choices):
+            choices = None
+        return {'choices': choices, 'submissions_count': state.get('submissions_count', 0)}
 
     def remove_vote(self):
         """
@@ -993,46 +1638,56 @@ class SurveyBlock(PollBase, CSVExportMixin):
         This means a user's old votes may still count indefinitely after a
         change, should they never revisit.
         """
-        questions = dict(self.questions)
-        answers = dict(self.answers)
-        for key, value in self.choices.items():
-            if key in questions:
-                if value in answers:
-                    self.tally[key][value] -= 1
+        self.counter_backend().update(self, self.vote_deltas(self.choices, -1))
         self.choices = None
         self.save()
 
+    def vote_deltas(self, choices, delta):
+        """
+        Return {(question, answer): delta} for each of choices that is still a current question and answer.
+        """
+        questions = self.item_index('questions')
+        answers = self.item_index('answers')
+        return {
+            (key, value): delta for key, value in choices.items()
+            if key in questions and value in answers
+        }
+
     def get_choices(self):
         """
         Gets the user's choices, if they're still valid.
         """
-        questions = dict(self.questions)
-        answers = dict(self.answers)
-        if self.choices is None:
+        choices = self.choices
+        if not choices:
+            # The field defaults to an empty dict for learners who have not voted.
             return None
-        if sorted(questions.keys()) != sorted(self.choices.keys()):
+        if not self.valid_choices(choices):
             self.remove_vote()
             return None
-        for value in self.choices.values():
-            if value not in answers:
-                self.remove_vote()
-                return None
+        return choices
+
+    @XBlock.handler
+    def get_results(self, request, suffix=''):
+        return self.results_response(request)
+
+    def results_settings(self):
+        return [self.questions, self.answers, self.feedback, self.block_name]
+
+    def results_choice(self):
         return self.choices
 
-    @PollBase.static_replace_json_handler
-    def get_results(self, data, suffix=''):
-        if self.private_results and not self.can_view_private_results():
+    def results_data(self, source_tally):
+        if source_tally is None:
             detail, total = {}, None
         else:
-            self.publish_event_from_dict(self.event_namespace + '.view_results', {})
-            detail, total = self.tally_detail()
+            detail, total = self.tally_detail(source_tally)
         return {
             'answers': [
                 {'key': key, 'label': label} for key, label in self.answers
             ],
             'tally': detail,
             'total': total,
-            'feedback': markdown(self.feedback),
+            'feedback': self.rendered_markdown_fields()['feedback'],
             'plural': total > 1,
             'block_name': self.block_name,
             # a11y: Transfer block ID to enable creating unique ids for questions and answers in the template
@@ -1065,8 +1720,8 @@ class SurveyBlock(PollBase, CSVExportMixin):
 
     @XBlock.json_handler
     def vote(self, data, suffix=''):
-        questions = dict(self.questions)
-        answers = dict(self.answers)
+        questions = self.item_index('questions')
+        answers = self.item_index('answers')
         result = {'success': True, 'errors': []}
         choices = self.get_choices()
         if choices and not self.private_results:
@@ -1083,7 +1738,7 @@ class SurveyBlock(PollBase, CSVExportMixin):
 
         # Make sure the user has included all questions, and hasn't included
         # anything extra, which might indicate the questions have changed.
-        if not sorted(data.keys()) == sorted(questions.keys()):
+        if frozenset(data) != questions.key_set:
             result['success'] = False
             result['errors'].append(
                 self.ugettext(
@@ -1094,7 +1749,7 @@ class SurveyBlock(PollBase, CSVExportMixin):
 
         # Make sure the answer values are sane.
         for key, value in data.items():
-            if value not in answers.keys():
+            if value not in answers:
                 result['success'] = False
                 result['errors'].append(
                     self.ugettext(
@@ -1107,18 +1762,24 @@ class SurveyBlock(PollBase, CSVExportMixin):
             result['can_vote'] = self.can_vote()
             return result
 
-        # Record the vote!
-        if self.choices:
-            self.remove_vote()
+        # Record the vote! Any earlier vote is taken out in the same counter update, so the learner's
+        # state and the tally are each written once, when the handler returns.
+        deltas = defaultdict(int)
+        if choices:
+            for path, delta in self.vote_deltas(choices, -1).items():
+                deltas[path] += delta
+        for path, delta in self.vote_deltas(data, 1).items():
+            deltas[path] += delta
+        self.clean_tally_if_changed()
+        self.counter_backend().update(self, deltas)
+        self.publish_tally()
+        submissions_count = self.submissions_count + 1
         self.choices = data
-        self.clean_tally()
-        for key, value in self.choices.items():
-            self.tally[key][value] += 1
-        self.submissions_count += 1
+        self.submissions_count = submissions_count
 
-        self.send_vote_event({'choices': self.choices})
+        self.send_vote_event({'choices': data})
         result['can_vote'] = self.can_vote()
-        result['submissions_count'] = self.submissions_count
+        result['submissions_count'] = submissions_count
         result['max_submissions'] = self.max_submissions
 
         return result
@@ -1145,6 +1806,7 @@ class SurveyBlock(PollBase, CSVExportMixin):
         self.private_results = private_results
         self.max_submissions = max_submissions
         self.block_name = block_name
+        self.rendered_markdown = self.render_markdown_fields()
 
         # Tally will not be updated until the next attempt to use it, per
         # scoping limitations.
@@ -1185,27 +1847,34 @@ class SurveyBlock(PollBase, CSVExportMixin):
              """)
         ]
 
+    def markdown_sources(self):
+        return {
+            'feedback': self.feedback,
+            'questions': {key: value['label'] for key, value in self.questions},
+        }
+
     def get_filename(self):
         return u"survey-data-export-{}.csv".format(time.strftime("%Y-%m-%d-%H%M%S", time.gmtime(time.time())))
 
-    def prepare_data(self):
+    def prepare_data(self, votes=None):
         header_row = ['user_id', 'username', 'user_email']
         sorted_questions = sorted(self.questions, key=lambda x: x[0])
         questions = [q[1]['label'] for q in sorted_questions]
-        data = {}
-        answers_dict = dict(self.answers)
-        for sm in self.student_module_queryset():
-            state = json.loads(sm.state)
-            if sm.student.id not in data and state.get('choices'):
-                row = [
-                    sm.student.id,
-                    sm.student.username,
-                    sm.student.email,
-                ]
-                for q in sorted_questions:
-                    choices = state.get('choices')
-                    if choices:
-                        choice = choices[q[0]]
-                        row.append(answers_dict[choice])
-                data[sm.student.id] = row
-        return [header_row + questions] + data.values()
+        yield header_row + questions
+        answers = self.item_index('answers')
+        if votes is None:
+            # There is one StudentModule row per learner and block, so rows need no de-duplication.
+            votes = self.export_votes()
+        for user_id, username, email, choices in votes:
+            row = [
+                user_id,
+                username,
+                email,
+            ]
+            for q in sorted_questions:
+                row.append(answers.label(choices[q[0]]))
+            yield row
+
+
+if django_setting('XBLOCK_POLL_PRELOAD_RESOURCES', False):
+    ResourceMixin.preload_resources()
@@ -1,6 +1,6 @@
 /* Javascript for PollBlock. */
 
-function PollUtil (runtime, element, pollType) {
+function PollUtil (runtime, element, pollType, initData) {
     var self = this;
     var exportStatus = {};
 
@@ -8,6 +8,7 @@ function PollUtil (runtime, element, pollType) {
         // Initialization function used for both Poll Types
         this.voteUrl = runtime.handlerUrl(element, 'vote');
         this.tallyURL = runtime.handlerUrl(element, 'get_results');
+        this.watchURL = runtime.handlerUrl(element, 'watch_results');
         this.csv_url= runtime.handlerUrl(element, 'csv_export');
         this.votedUrl = runtime.handlerUrl(element, 'student_voted');
         this.submit = $('input[type=button]', element);
@@ -49,7 +50,8 @@ function PollUtil (runtime, element, pollType) {
                 return opts.inverse(this);
         });
 
-        this.resultsTemplate = Handlebars.compile($("." + pollType + "-results-template", element).html());
+        // Precompiled from public/handlebars/ by scripts/precompile_templates.js.
+        this.resultsTemplate = Handlebars.templates[pollType + '_results'];
 
         this.viewResultsButton = $('.view-results-button', element);
         this.viewResultsButton.click(this.getResults);
@@ -60,6 +62,10 @@ function PollUtil (runtime, element, pollType) {
         this.downloadResultsButton = $('.download-results-button', element);
         this.downloadResultsButton.click(this.downloadCsv);
 
+        // student_view sends the initial state along with the page; only older servers need asking.
+        if (initData) {
+            return $.Deferred().resolve(initData).promise();
+        }
         return this.shouldDisplayResults();
     };
 
@@ -234,8 +240,8 @@ function PollUtil (runtime, element, pollType) {
         window.location = exportStatus.download_url;
     };
 
-    this.getResults = function () {
-        // Used if results are not private, to show the user how other students voted.
+    this.renderResults = function (data, focus) {
+        // Render the results template, and size the percentage gauges once any images have loaded.
         function adjustGaugeBackground() {
             // Adjust the height of the grey background of the the percentage gauges.  This
             // couldn't be achieved with CSS.
@@ -261,20 +267,148 @@ function PollUtil (runtime, element, pollType) {
             });
             if (--missingImages == 0) callback();
         }
+        $('div.poll-block', element).html(self.resultsTemplate(data));
+        if (focus) {
+            $('.poll-results-wrapper', element).focus();
+        }
+        whenImagesLoaded(adjustGaugeBackground);
+    };
+
+    this.getResults = function () {
+        // Used if results are not private, to show the user how other students voted.
         $.ajax({
             // Semantically, this would be better as GET, but we can use helper
             // functions with POST.
             type: "POST",
             url: self.tallyURL,
             data: JSON.stringify({}),
-            success: function (data) {
-                $('div.poll-block', element).html(self.resultsTemplate(data));
-                $('.poll-results-wrapper', element).focus();
-                whenImagesLoaded(adjustGaugeBackground);
+            // Browsers do not revalidate POST responses themselves, so send the ETag of the results we
+            // already have: the server answers 304 if they are still current.
+            headers: self.resultsETag ? {'If-None-Match': self.resultsETag} : {},
+            success: function (data, status, xhr) {
+                if (xhr.status === 304) {
+                    self.showResults(self.results, self.resultsETag);
+                } else {
+                    self.showResults(data, xhr.getResponseHeader('ETag'));
+                }
             }
         });
     };
 
+    this.showResults = function (data, etag) {
+        // Display results fetched from get_results, or sent with the page.
+        self.results = data;
+        self.resultsETag = etag;
+        self.renderResults(data, true);
+        if ($('div.poll-block', element).data('live')) {
+            self.watchResults();
+        }
+    };
+
+    this.updateCounts = function (counts) {
+        // Apply [path, count] pairs from watch_results to the displayed results, and recompute the
+        // totals and percentages the same way the server does.
+        var results = self.results;
+        function percent(count, total) {
+            return total ? Math.round(count / total * 100) : 0;
+        }
+        if (pollType == 'poll') {
+            $.each(counts, function (index, item) {
+                $.each(results.tally, function (answerIndex, answer) {
+                    if (answer.key == item[0][0]) answer.count = item[1];
+                });
+            });
+            results.total = 0;
+            $.each(results.tally, function (index, answer) { results.total += answer.count; });
+            $.each(results.tally, function (index, answer) {
+                answer.percent = percent(answer.count, results.total);
+                answer.first = answer.last = false;
+            });
+            results.tally.sort(function (a, b) { return b.count - a.count; });
+            if (results.tally.length) {
+                results.tally[0].first = true;
+                results.tally[results.tally.length - 1].last = true;
+            }
+        } else {
+            $.each(counts, function (index, item) {
+                $.each(results.tally, function (questionIndex, question) {
+                    if (question.key != item[0][0]) return;
+                    $.each(question.answers, function (answerIndex, answer) {
+                        if (answer.key == item[0][1]) answer.count = item[1];
+                    });
+                });
+            });
+            results.total = 0;
+            if (results.tally.length) {
+                $.each(results.tally[0].answers, function (index, answer) { results.total += answer.count; });
+            }
+            $.each(results.tally, function (questionIndex, question) {
+                var highest = 0, top = null;
+                $.each(question.answers, function (index, answer) {
+                    answer.percent = percent(answer.count, results.total);
+                    answer.top = false;
+                    if (answer.count > highest) {
+                        highest = answer.count;
+                        top = answer;
+                    }
+                });
+                if (top) top.top = true;
+            });
+        }
+        results.plural = results.total > 1;
+    };
+
+    this.watchResults = function () {
+        // Long-poll watch_results and re-render the results whenever the counts change. Backs off when
+        // requests fail, so an unavailable server is not hammered, and waits between requests that the
+        // server answers straight away (e.g. with a low LIVE_RESULTS_TIMEOUT).
+        var failures = 0;
+        var minInterval = 5000;
+        if (self.watching) {
+            return;
+        }
+        self.watching = true;
+        function watch() {
+            var started = new Date().getTime();
+            $.ajax({
+                type: 'GET',
+                url: self.watchURL,
+                data: {since: self.results.tally_version},
+                dataType: 'json'
+            }).done(function (data) {
+                failures = 0;
+                if (!data.live) {
+                    self.watching = false;
+                    return;
+                }
+                if (data.changed) {
+                    var counts = data.changes || [];
+                    if (data.tally) {
+                        $.each(data.tally, function (key, value) {
+                            if ($.isPlainObject(value)) {
+                                $.each(value, function (answer, count) { counts.push([[key, answer], count]); });
+                            } else {
+                                counts.push([[key], value]);
+                            }
+                        });
+                    }
+                    self.updateCounts(counts);
+                    self.results.tally_version = data.version;
+                    // The results no longer match the ETag they were fetched with.
+                    self.resultsETag = null;
+                    self.renderResults(self.results, false);
+                }
+                // Wait a moment before asking again, so that a burst of votes is shown as one update.
+                var elapsed = new Date().getTime() - started;
+                setTimeout(watch, Math.max(data.changed ? 1000 : 0, minInterval - elapsed));
+            }).fail(function () {
+                failures++;
+                setTimeout(watch, Math.min(1000 * Math.pow(2, failures), 60000));
+            });
+        }
+        watch();
+    };
+
     this.disableSubmit = function() {
         // Disable the submit button.
         self.submit.attr("disabled", true);
@@ -291,7 +425,11 @@ function PollUtil (runtime, element, pollType) {
         // If the submit button doesn't exist, the user has already
         // selected a choice. Render results instead of initializing machinery.
         if (data['voted'] && ! data['private_results']) {
-            self.onSubmit({'success': true});
+            if (data['results']) {
+                self.showResults(data['results'], data['results_etag']);
+            } else {
+                self.onSubmit({'success': true});
+            }
             $('.poll-block-form-wrapper', element).hide();
         }
         else {
@@ -307,10 +445,10 @@ function PollUtil (runtime, element, pollType) {
     });
 }
 
-function PollBlock(runtime, element) {
-    new PollUtil(runtime, element, 'poll');
+function PollBlock(runtime, element, initData) {
+    new PollUtil(runtime, element, 'poll', initData);
 }
 
-function SurveyBlock(runtime, element) {
-    new PollUtil(runtime, element, 'survey');
+function SurveyBlock(runtime, element, initData) {
+    new PollUtil(runtime, element, 'survey', initData);
 }
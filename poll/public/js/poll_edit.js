@@ -12,7 +12,6 @@ function PollEditUtil(runtime, element, pollType) {
 
     this.init = function () {
         // Set up the editing form for a Poll or Survey.
-        var temp = $('.poll-form-component', element).html();
 
         // Set up gettext in case it isn't available in the client runtime:
         if (typeof gettext == "undefined") {
@@ -38,7 +37,8 @@ function PollEditUtil(runtime, element, pollType) {
                 });
         });
 
-        self.answerTemplate = Handlebars.compile(temp);
+        // Precompiled from public/handlebars/ by scripts/precompile_templates.js.
+        self.answerTemplate = Handlebars.templates['poll_studio'];
 
         $(element).find('.cancel-button', element).bind('click', function() {
             runtime.notify('cancel', {});
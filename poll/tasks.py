@@ -6,11 +6,21 @@ from lms.djangoapps.instructor_task.models import ReportStore  # pylint: disable
 from opaque_keys.edx.keys import CourseKey, UsageKey  # pylint: disable=import-error
 from xmodule.modulestore.django import modulestore  # pylint: disable=import-error
 
+from .export import (
+    CHUNK_SIZE, COURSE_CONCURRENCY, delete_snapshot, snapshot_name, write_course_archive, write_csv,
+    write_incremental_report
+)
+from .utils import django_setting
+
 
 @task()
-def export_csv_data(block_id, course_id):
+def export_csv_data(block_id, course_id, snapshot=None):
     """
     Exports student answers to all supported questions to a CSV file.
+
+    With XBLOCK_POLL_INCREMENTAL_EXPORTS, snapshot is the 'snapshot' entry of the previous export's result, and
+    only learners whose state changed since that export are read from the database. Snapshots hold learners'
+    usernames and emails, so they are kept in the same private storage as the reports.
     """
 
     src_block = modulestore().get_item(UsageKey.from_string(block_id))
@@ -19,15 +29,76 @@ def export_csv_data(block_id, course_id):
     course_key = CourseKey.from_string(course_id)
 
     filename = src_block.get_filename()
+    chunk_size = django_setting('XBLOCK_POLL_EXPORT_CHUNK_SIZE', CHUNK_SIZE)
 
     report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
-    report_store.store_rows(course_key, filename, src_block.prepare_data())
+    # The rows are streamed to a temporary file rather than handed to store_rows(), which builds the
+    # whole CSV in memory.
+    if django_setting('XBLOCK_POLL_INCREMENTAL_EXPORTS', False):
+        output, snapshot = write_incremental_report(
+            src_block, report_store.storage, snapshot_name(block_id), snapshot, start_timestamp, chunk_size
+        )
+    else:
+        output, snapshot = write_csv(src_block.prepare_data(), chunk_size), None
+    try:
+        report_store.store(course_key, filename, output)
+    except Exception:
+        # This export's result won't be recorded, so nothing would ever point to its snapshot.
+        delete_snapshot(report_store.storage, snapshot)
+        raise
+    finally:
+        output.close()
 
     generation_time_s = time.time() - start_timestamp
 
-    return {
+    result = {
         "error": None,
         "report_filename": filename,
         "start_timestamp": start_timestamp,
         "generation_time_s": generation_time_s,
     }
+    if snapshot:
+        result["snapshot"] = snapshot
+    return result
+
+
+@task(bind=True)
+def export_course_csv_data(self, course_id):
+    """
+    Exports student answers to every poll and survey in a course, as one zip file of CSV files.
+
+    Up to XBLOCK_POLL_COURSE_EXPORT_CONCURRENCY blocks are exported at once. While the task runs, its state is
+    PROGRESS, with the number of blocks done and the total number of blocks in its meta.
+    """
+    start_timestamp = time.time()
+    course_key = CourseKey.from_string(course_id)
+    store = modulestore()
+    blocks = [
+        (u'{}-{}.csv'.format(block.location.block_type, block.location.block_id), block)
+        for block_type in ('poll', 'survey')
+        for block in store.get_items(course_key, qualifiers={'category': block_type})
+    ]
+    filename = u"poll-survey-data-export-{}.zip".format(time.strftime("%Y-%m-%d-%H%M%S", time.gmtime(start_timestamp)))
+
+    def progress(done, total):
+        self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+
+    output = write_course_archive(
+        blocks,
+        django_setting('XBLOCK_POLL_COURSE_EXPORT_CONCURRENCY', COURSE_CONCURRENCY),
+        progress,
+        django_setting('XBLOCK_POLL_EXPORT_CHUNK_SIZE', CHUNK_SIZE),
+    )
+    try:
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        report_store.store(course_key, filename, output)
+    finally:
+        output.close()
+
+    return {
+        "error": None,
+        "report_filename": filename,
+        "start_timestamp": start_timestamp,
+        "generation_time_s": time.time() - start_timestamp,
+        "blocks": len(blocks),
+    }
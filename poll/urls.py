@@ -0,0 +1,10 @@
+"""
+URLs for the Poll and Survey LMS views, e.g. url(r'^xblock-poll/', include('poll.urls')).
+"""
+from django.conf.urls import url  # pylint: disable=import-error
+
+from . import views
+
+urlpatterns = [
+    url(r'^user_state/$', views.user_state, name='xblock_poll_user_state'),
+]
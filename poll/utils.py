@@ -5,3 +5,14 @@
 # Make '_' a no-op so we can scrape strings
 def _(text):
     return text
+
+
+def django_setting(name, default=None):
+    """
+    Read a Django setting, falling back to default outside of a configured Django project.
+    """
+    try:
+        from django.conf import settings  # pylint: disable=import-error
+        return getattr(settings, name, default)
+    except Exception:
+        return default
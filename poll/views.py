@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 McKinsey Academy
+#
+# Authors:
+#          Jonathan Piacenti <jonathan@opencraft.com>
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+LMS views returning the state of many Poll and Survey blocks in one request.
+
+These are edX LMS specific. To enable them, include poll.urls in the LMS URL configuration.
+"""
+from collections import defaultdict
+import json
+
+from django.contrib.auth.decorators import login_required  # pylint: disable=import-error
+from django.http import HttpResponseBadRequest, JsonResponse  # pylint: disable=import-error
+from django.views.decorators.http import require_GET  # pylint: disable=import-error
+
+from courseware.models import (  # pylint: disable=import-error
+    StudentModule, XModuleUserStateSummaryField
+)
+from opaque_keys import InvalidKeyError  # pylint: disable=import-error
+from opaque_keys.edx.keys import UsageKey  # pylint: disable=import-error
+from student.models import CourseEnrollment  # pylint: disable=import-error
+from xmodule.modulestore.django import modulestore  # pylint: disable=import-error
+
+from . import counters
+from .utils import django_setting
+
+BLOCK_TYPES = ('poll', 'survey')
+# The most blocks that can be asked for in one request.
+MAX_BLOCKS = 100
+
+
+def load_blocks(user, usage_keys):
+    """
+    Return {usage id: block} for the requested blocks in courses the user is enrolled in, loading each
+    course's polls and surveys in one query.
+
+    Only the blocks' settings are used; no user state is loaded with them.
+    """
+    wanted = defaultdict(set)
+    courses = {usage_key.course_key for usage_key in usage_keys}
+    allowed = {
+        course_key for course_key in courses
+        if user.is_staff or CourseEnrollment.is_enrolled(user, course_key)
+    }
+    for usage_key in usage_keys:
+        if usage_key.course_key not in allowed:
+            continue
+        wanted[(usage_key.course_key, usage_key.block_type)].add(unicode(usage_key))
+    blocks = {}
+    store = modulestore()
+    for (course_key, block_type), usage_ids in wanted.items():
+        for block in store.get_items(course_key, qualifiers={'category': block_type}):
+            usage_id = unicode(block.location)
+            if usage_id in usage_ids:
+                blocks[usage_id] = block
+    return blocks
+
+
+@login_required
+@require_GET
+def user_state(request):
+    """
+    Return what student_view_user_state returns, for each block given as a `usage_id` query parameter.
+
+    The response is {"blocks": {usage id: {"choice" or "choices", "tally", "submissions_count"}}}. Blocks
+    that do not exist, or are in courses the learner is not enrolled in, are left out. The learner's state
+    and the blocks' tallies are each read with one query, and the counts kept by the counter backend with
+    one cache call.
+    """
+    try:
+        usage_keys = [UsageKey.from_string(usage_id) for usage_id in request.GET.getlist('usage_id')]
+    except InvalidKeyError:
+        return HttpResponseBadRequest('Invalid usage_id.')
+    if not usage_keys or len(usage_keys) > MAX_BLOCKS:
+        return HttpResponseBadRequest('Between 1 and {} usage_id parameters are required.'.format(MAX_BLOCKS))
+    if any(usage_key.block_type not in BLOCK_TYPES for usage_key in usage_keys):
+        return HttpResponseBadRequest('Only poll and survey blocks are supported.')
+
+    blocks = load_blocks(request.user, usage_keys)
+    keys = [usage_key for usage_key in usage_keys if unicode(usage_key) in blocks]
+    states = {
+        unicode(module.module_state_key): json.loads(module.state or '{}')
+        for module in StudentModule.objects.filter(
+            student=request.user, module_state_key__in=keys
+        ).only('module_state_key', 'state')
+    }
+    stored_tallies = {
+        unicode(field.usage_id): json.loads(field.value)
+        for field in XModuleUserStateSummaryField.objects.filter(
+            usage_id__in=keys, field_name='tally'
+        ).only('usage_id', 'value')
+    }
+
+    backend = counters.get_backend(django_setting('XBLOCK_SETTINGS', {}).get('poll', {}))
+    tallies = backend.tallies({
+        usage_id: counters.merge_counts(block.blank_tally(), stored_tallies.get(usage_id))
+        for usage_id, block in blocks.items()
+    })
+    response = {}
+    for usage_id, block in blocks.items():
+        response[usage_id] = block.stored_user_state(states.get(usage_id, {}))
+        response[usage_id]['tally'] = tallies[usage_id]
+    return JsonResponse({'blocks': response})
@@ -0,0 +1,80 @@
+#!/usr/bin/env node
+/*
+ * Precompile the Handlebars templates used by the Poll and Survey XBlocks.
+ *
+ * Run from the repository root after editing anything in poll/public/handlebars/:
+ *
+ *     node scripts/precompile_templates.js
+ *
+ * This writes:
+ *  - poll/public/js/templates.js: every poll/public/handlebars/<name>.handlebars file, precompiled and
+ *    registered as Handlebars.templates['<name>'].
+ *  - poll/public/js/vendor/handlebars.runtime.js: the runtime-only part of the vendored Handlebars build,
+ *    which is all the browser needs to render precompiled templates.
+ *
+ * Both files are checked in, so deployments do not need node.
+ */
+'use strict';
+
+var fs = require('fs');
+var path = require('path');
+var vm = require('vm');
+
+var root = path.resolve(__dirname, '..');
+var publicDir = path.join(root, 'poll', 'public');
+var templateDir = path.join(publicDir, 'handlebars');
+var vendorDir = path.join(publicDir, 'js', 'vendor');
+
+var fullBuild = fs.readFileSync(path.join(vendorDir, 'handlebars.js'), 'utf8');
+
+function loadCompiler() {
+    // The full build declares a global Handlebars; evaluate it in its own context to get the compiler.
+    var sandbox = {};
+    vm.runInNewContext(fullBuild + '\nthis.Handlebars = Handlebars;', sandbox);
+    return sandbox.Handlebars;
+}
+
+function runtimeBuild() {
+    // The full build is the runtime modules followed by the compiler modules, each one starting with a
+    // "// <module>.js" comment. Keep everything up to the compiler and export the runtime namespace.
+    var compilerStart = fullBuild.indexOf('// handlebars/compiler/');
+    if (compilerStart === -1) {
+        throw new Error('Could not find the compiler modules in vendor/handlebars.js');
+    }
+    return fullBuild.slice(0, compilerStart) + '  return __module1__;\n})();\n';
+}
+
+function templateSource(fileName) {
+    // Each template file wraps its source in a <script type="text/html"> tag; precompile what is inside.
+    var content = fs.readFileSync(path.join(templateDir, fileName), 'utf8');
+    var match = /^\s*<script[^>]*>([\s\S]*)<\/script>\s*$/.exec(content);
+    if (!match) {
+        throw new Error(fileName + ' is not wrapped in a single <script> tag');
+    }
+    return match[1];
+}
+
+function main() {
+    var Handlebars = loadCompiler();
+    var names = fs.readdirSync(templateDir).filter(function(fileName) {
+        return path.extname(fileName) === '.handlebars';
+    }).sort();
+
+    var output = [
+        '/* Generated by scripts/precompile_templates.js from poll/public/handlebars/. Do not edit. */',
+        '(function() {',
+        '  var templates = Handlebars.templates = Handlebars.templates || {};'
+    ];
+    names.forEach(function(fileName) {
+        var name = path.basename(fileName, '.handlebars');
+        var spec = Handlebars.precompile(templateSource(fileName));
+        output.push('  templates[' + JSON.stringify(name) + '] = Handlebars.template(' + spec + ');');
+    });
+    output.push('})();', '');
+
+    fs.writeFileSync(path.join(publicDir, 'js', 'templates.js'), output.join('\n'));
+    fs.writeFileSync(path.join(vendorDir, 'handlebars.runtime.js'), runtimeBuild());
+    console.log('Precompiled ' + names.length + ' templates.');
+}
+
+main();
@@ -0,0 +1,99 @@
+import unittest
+
+from mock import Mock, patch
+
+from poll.cache import LRUCache, MarkdownCache, SnapshotCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """
+    Tests for the process-wide LRU cache.
+    """
+    def test_get_or_set(self):
+        """
+        Values are computed once and counted as hits afterwards.
+        """
+        cache = LRUCache(maxsize=2)
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(cache.get_or_set('key', factory), 'value')
+        self.assertEqual(cache.get_or_set('key', factory), 'value')
+        self.assertEqual(len(calls), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_eviction(self):
+        """
+        The least recently used entry is evicted once the cache is full.
+        """
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class TestMarkdownCache(unittest.TestCase):
+    """
+    Tests for the markdown rendering cache.
+    """
+    def test_render_once(self):
+        """
+        The same source is only rendered once.
+        """
+        cache = MarkdownCache()
+        self.assertEqual(cache.render(u'**bold**'), u'<p><strong>bold</strong></p>')
+        self.assertEqual(cache.render(u'**bold**'), u'<p><strong>bold</strong></p>')
+        self.assertEqual(cache.stats()['renders'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_extensions_change_key(self):
+        """
+        Different extension sets never share cache entries.
+        """
+        self.assertNotEqual(
+            MarkdownCache().cache_key(u'text'),
+            MarkdownCache(extensions=['markdown.extensions.extra']).cache_key(u'text'),
+        )
+
+    def test_shared_cache(self):
+        """
+        HTML rendered by one process is picked up from the shared cache by another.
+        """
+        shared = {}
+        shared_cache = Mock(get=shared.get, set=shared.__setitem__)
+        MarkdownCache().render(u'*shared*', shared_cache=shared_cache)
+        other_process = MarkdownCache()
+        self.assertEqual(other_process.render(u'*shared*', shared_cache=shared_cache), u'<p><em>shared</em></p>')
+        self.assertEqual(other_process.stats()['renders'], 0)
+        self.assertEqual(other_process.stats()['shared_hits'], 1)
+
+
+class TestSnapshotCache(unittest.TestCase):
+    """
+    Tests for the results snapshot cache.
+    """
+    def test_get_or_build(self):
+        """
+        Snapshots are built once per key, and the age of those served is recorded.
+        """
+        cache = SnapshotCache(maxsize=4)
+        build = Mock(return_value='{}')
+        with patch('poll.cache.time.time', side_effect=[100.0, 103.0, 104.0]):
+            self.assertEqual(cache.get_or_build('v1', build), '{}')
+            self.assertEqual(cache.get_or_build('v1', build), '{}')
+            self.assertEqual(cache.get_or_build('v1', build), '{}')
+        self.assertEqual(build.call_count, 1)
+        stats = cache.stats()
+        self.assertEqual((stats['builds'], stats['hits']), (1, 2))
+        self.assertEqual(stats['mean_age'], 3.5)
+        self.assertEqual(stats['max_age'], 4.0)
@@ -0,0 +1,221 @@
+import json
+import threading
+import unittest
+
+from django.core.cache.backends.locmem import LocMemCache
+from mock import patch
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+
+from poll.counters import VoteBuffer, iter_counts, merge_counts
+from poll.poll import PollBlock, SurveyBlock
+from ..utils import MockRuntime, make_block, make_request
+
+
+class ClampingCache(LocMemCache):
+    """
+    A local memory cache whose incr() stops at zero, as memcached's does.
+    """
+    def incr(self, key, delta=1, version=None):
+        value = self.get(key, version=version)
+        if value is None:
+            raise ValueError("Key '%s' not found" % key)
+        value = max(value + delta, 0)
+        self.set(key, value, None, version=version)
+        return value
+
+
+class TestCacheBackend(unittest.TestCase):
+    """
+    Tests for the atomic cache counter backend.
+    """
+    def setUp(self):
+        super(TestCacheBackend, self).setUp()
+        self.cache = LocMemCache('poll-counters', {})
+        self.cache.clear()
+        patcher = patch('django.core.cache.caches', {'default': self.cache})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(PollBlock, 'get_xblock_settings', return_value={'COUNTER_BACKEND': 'cache'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_block(self, block_class=PollBlock, user_id='student', **field_data):
+        return make_block(block_class, user_id, **field_data)
+
+    def vote(self, block, data):
+        response = json.loads(block.handle('vote', make_request(json.dumps(data))).body)
+        self.assertTrue(response['success'], response)
+
+    def test_seeded_from_tally_field(self):
+        """
+        Counts start from the values already stored in the tally field.
+        """
+        stored_tally = {'R': 5, 'B': 1, 'G': 0, 'O': 0}
+        self.vote(self.make_block(tally=stored_tally), {'choice': 'R'})
+        self.assertEqual(self.make_block(tally=stored_tally).current_tally(), {'R': 6, 'B': 1, 'G': 0, 'O': 0})
+
+    def test_survey_counts(self):
+        """
+        Survey counts are kept per question and answer.
+        """
+        with patch.object(SurveyBlock, 'get_xblock_settings', return_value={'COUNTER_BACKEND': 'cache'}):
+            self.vote(self.make_block(SurveyBlock), {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'})
+            self.vote(self.make_block(SurveyBlock), {'enjoy': 'Y', 'recommend': 'Y', 'learn': 'M'})
+            tally = self.make_block(SurveyBlock).current_tally()
+        self.assertEqual(tally['enjoy'], {'Y': 2, 'N': 0, 'M': 0})
+        self.assertEqual(tally['recommend'], {'Y': 1, 'N': 1, 'M': 0})
+
+    def test_parallel_voters(self):
+        """
+        Stress test: no votes are lost when many learners vote at the same time.
+
+        Every voter works from the same stale copy of the tally field, as concurrent requests would.
+        """
+        voters, votes_per_voter = 8, 50
+        errors = []
+
+        def run_voter():
+            try:
+                for __ in range(votes_per_voter):
+                    self.vote(self.make_block(), {'choice': 'B'})
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        # XBlock computes the class' field list lazily, and that is not thread-safe: do it up front.
+        PollBlock.fields  # pylint: disable=pointless-statement
+        threads = [threading.Thread(target=run_voter) for __ in range(voters)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        tally = self.make_block().current_tally()
+        self.assertEqual(tally['B'], voters * votes_per_voter)
+        self.assertEqual(sum(count for __, count in iter_counts(tally)), voters * votes_per_voter)
+
+    def test_sharded_counts(self):
+        """
+        Votes are spread over shards by learner, summed when read, and folded back into the tally field.
+        """
+        stored_tally = {'R': 10, 'B': 0, 'G': 0, 'O': 0}
+        settings = {'COUNTER_BACKEND': 'cache', 'COUNTER_SHARDS': 4}
+        with patch.object(PollBlock, 'get_xblock_settings', return_value=settings):
+            for learner in range(20):
+                block = self.make_block(user_id='learner-{}'.format(learner), tally=stored_tally)
+                self.vote(block, {'choice': 'R' if learner % 2 else 'G'})
+            self.assertGreater(len(self.cache._cache), 2)  # pylint: disable=protected-access
+
+            block = self.make_block(tally=stored_tally)
+            self.assertEqual(block.tally, stored_tally)
+            self.assertEqual(block.current_tally(), {'R': 20, 'B': 0, 'G': 10, 'O': 0})
+
+            block.runtime.user_is_staff = True
+            response = json.loads(block.handle('fold_tally_shards', make_request('{}')).body)
+            self.assertEqual(response['tally'], {'R': 20, 'B': 0, 'G': 10, 'O': 0})
+            self.assertEqual(block.tally, {'R': 20, 'B': 0, 'G': 10, 'O': 0})
+            self.assertEqual(self.make_block(tally=block.tally).current_tally(), block.tally)
+
+    def test_revote_on_shard_without_vote(self):
+        """
+        A learner can take back a vote from a shard that never counted it, even if the cache clamps at zero.
+        """
+        cache = ClampingCache('poll-counters-clamping', {})
+        settings = {'COUNTER_BACKEND': 'cache', 'COUNTER_SHARDS': 4}
+        with patch('django.core.cache.caches', {'default': cache}), \
+                patch.object(PollBlock, 'get_xblock_settings', return_value=settings):
+            learners = (self.make_block(user_id='learner-{}'.format(learner)) for learner in range(100))
+            user_id = next(
+                learner.scope_ids.user_id for learner in learners if learner.counter_backend().shard_for(learner)
+            )
+            # The learner's vote was folded into the tally field, and all the shards were reset.
+            block = self.make_block(
+                user_id=user_id, tally={'R': 1, 'B': 0, 'G': 0, 'O': 0}, choice='R', submissions_count=1,
+                max_submissions=0, private_results=True,
+            )
+            self.vote(block, {'choice': 'G'})
+            self.assertEqual(block.current_tally(), {'R': 0, 'B': 0, 'G': 1, 'O': 0})
+
+    def test_fold_requires_staff(self):
+        """
+        Only staff may fold the shards.
+        """
+        response = json.loads(self.make_block().handle('fold_tally_shards', make_request('{}')).body)
+        self.assertFalse(response['success'])
+
+    def test_bulk_tallies(self):
+        """
+        The counts of many blocks are read with a single cache call.
+        """
+        stored = {}
+        for usage_id in ('poll-a', 'poll-b'):
+            block = PollBlock(MockRuntime(), DictFieldData({}), ScopeIds('student', 'poll', usage_id, usage_id))
+            self.vote(block, {'choice': 'O' if usage_id == 'poll-a' else 'G'})
+            stored[usage_id] = {'R': 0, 'B': 0, 'G': 0, 'O': 0}
+
+        backend = PollBlock(MockRuntime(), DictFieldData({}), None).counter_backend()
+        with patch.object(self.cache, 'get_many', wraps=self.cache.get_many) as get_many:
+            tallies = backend.tallies(stored)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(tallies['poll-a'], {'R': 0, 'B': 0, 'G': 0, 'O': 1})
+        self.assertEqual(tallies['poll-b'], {'R': 0, 'B': 0, 'G': 1, 'O': 0})
+        self.assertEqual(stored['poll-a']['O'], 0)
+
+    def test_merge_counts(self):
+        """
+        Stored counts are laid over a blank tally, dropping those for removed answers.
+        """
+        blank = {'enjoy': {'Y': 0, 'N': 0}, 'learn': {'Y': 0, 'N': 0}}
+        stored = {'enjoy': {'Y': 3, 'M': 2}, 'gone': {'Y': 1}}
+        self.assertEqual(merge_counts(blank, stored), {'enjoy': {'Y': 3, 'N': 0}, 'learn': {'Y': 0, 'N': 0}})
+        self.assertEqual(merge_counts(blank, None), blank)
+
+    def test_buffered_votes(self):
+        """
+        Buffered votes count straight away in this process, and reach the cache when the buffer is flushed.
+        """
+        buffer = VoteBuffer()
+        settings = {'COUNTER_BACKEND': 'cache', 'VOTE_BUFFER': True, 'VOTE_BUFFER_MAX_VOTES': 5,
+                    'VOTE_BUFFER_INTERVAL': 3600}
+        stored_tally = {'R': 2, 'B': 0, 'G': 0, 'O': 0}
+        with patch('poll.counters.VOTE_BUFFER', buffer), \
+                patch.object(PollBlock, 'get_xblock_settings', return_value=settings):
+            for __ in range(3):
+                self.vote(self.make_block(tally=stored_tally), {'choice': 'B'})
+            self.assertEqual(len(self.cache._cache), 0)  # pylint: disable=protected-access
+            self.assertEqual(buffer.stats()['pending_votes'], 3)
+            self.assertEqual(self.make_block(tally=stored_tally).current_tally(), {'R': 2, 'B': 3, 'G': 0, 'O': 0})
+
+            # The fifth vote fills the buffer and flushes it.
+            for __ in range(2):
+                self.vote(self.make_block(tally=stored_tally), {'choice': 'R'})
+            stats = buffer.stats()
+            self.assertEqual(stats['pending_votes'], 0)
+            self.assertEqual(stats['flushes'], 1)
+            self.assertGreaterEqual(stats['last_flush_delay'], stats['last_flush_duration'])
+            self.assertEqual(self.make_block(tally=stored_tally).current_tally(), {'R': 4, 'B': 3, 'G': 0, 'O': 0})
+
+            self.vote(self.make_block(tally=stored_tally), {'choice': 'G'})
+            buffer.flush()
+            self.assertEqual(self.make_block(tally=stored_tally).current_tally(), {'R': 4, 'B': 3, 'G': 1, 'O': 0})
+
+    def test_failed_flush_keeps_votes(self):
+        """
+        A vote that fills the buffer succeeds even if the flush fails, and every vote is applied exactly once later.
+        """
+        buffer = VoteBuffer()
+        settings = {'COUNTER_BACKEND': 'cache', 'VOTE_BUFFER': True, 'VOTE_BUFFER_MAX_VOTES': 2,
+                    'VOTE_BUFFER_INTERVAL': 3600}
+        stored_tally = {'R': 0, 'B': 0, 'G': 0, 'O': 0}
+        with patch('poll.counters.VOTE_BUFFER', buffer), \
+                patch.object(PollBlock, 'get_xblock_settings', return_value=settings):
+            with patch('poll.counters.increment', side_effect=ValueError('Cache unavailable')) as increment:
+                for choice in ('R', 'B'):
+                    self.vote(self.make_block(tally=stored_tally), {'choice': choice})
+            self.assertTrue(increment.called)
+            self.assertEqual(len(self.cache._cache), 0)  # pylint: disable=protected-access
+
+            buffer.flush()
+            self.assertEqual(buffer.stats()['pending_counters'], 0)
+            self.assertEqual(self.make_block(tally=stored_tally).current_tally(), {'R': 1, 'B': 1, 'G': 0, 'O': 0})
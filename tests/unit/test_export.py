@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from mock import Mock, patch
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+
+from poll.export import (
+    DECODERS, EXPORT_FIELDS, Snapshot, chunks, delete_stale_snapshots, get_decoder, keyset_batches, snapshot_name,
+    votes, write_course_archive, write_csv, write_incremental_report
+)
+from poll.poll import PollBlock, SurveyBlock
+from ..utils import MockRuntime
+
+log = logging.getLogger(__name__)
+
+
+def student_module_model():
+    """
+    Return a stand-in for the LMS StudentModule model, with its table and the user table in a SQLite database.
+    """
+    # pylint: disable=import-error
+    import django
+    from django.conf import settings
+    if not settings.configured:
+        settings.configure(
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes'],
+        )
+    django.setup()
+    from django.contrib.auth.models import User
+    from django.db import connection, models
+
+    if not hasattr(student_module_model, 'model'):
+        class StudentModule(models.Model):
+            student = models.ForeignKey(User, on_delete=models.CASCADE)
+            module_state_key = models.CharField(max_length=255, db_index=True)
+            course_id = models.CharField(max_length=255)
+            state = models.TextField(null=True, blank=True)
+            modified = models.DateTimeField(auto_now=True, db_index=True)
+
+            class Meta(object):
+                app_label = 'auth'
+                db_table = 'poll_test_studentmodule'
+
+        student_module_model.model = StudentModule
+        existing = connection.introspection.table_names()
+        with connection.schema_editor() as editor:
+            for model in (User, StudentModule):
+                if model._meta.db_table not in existing:
+                    editor.create_model(model)
+    return student_module_model.model
+
+
+def export_row(user_id, state):
+    """
+    Return a row as export_rows() yields it.
+    """
+    return user_id, u'user{}'.format(user_id), u'user{}@example.com'.format(user_id), json.dumps(state)
+
+
+class TestWriteCSV(unittest.TestCase):
+    """
+    Tests for streaming rows into a CSV file.
+    """
+    def test_chunks(self):
+        self.assertEqual(list(chunks(xrange(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunks([], 2)), [])
+
+    def test_rows_pulled_one_chunk_at_a_time(self):
+        """
+        No more than one chunk of rows is read ahead of what has been written.
+        """
+        pulled = []
+
+        def rows():
+            for index in xrange(10):
+                pulled.append(index)
+                yield [index, u'réponse']
+
+        written = []
+        with patch('poll.export.csv.writer') as writer:
+            writer.return_value.writerows.side_effect = lambda chunk: written.append((len(pulled), len(chunk)))
+            write_csv(rows(), chunk_size=4)
+        self.assertEqual(written, [(4, 4), (8, 4), (10, 2)])
+
+    def test_output(self):
+        output = write_csv([['user_id', 'answer'], [1, u'réponse']], chunk_size=1)
+        self.assertEqual(list(csv.reader(output)), [['user_id', 'answer'], ['1', 'r\xc3\xa9ponse']])
+
+
+def synthetic_states(count, seed=0):
+    """
+    Yield count learner states like those stored for polls and surveys, a third of them without a vote.
+    """
+    generator = random.Random(seed)
+    samples = []
+    for index in xrange(1000):
+        state = {'submissions_count': generator.randint(0, 3), 'position': index}
+        kind = index % 3
+        if kind == 1:
+            state['choice'] = generator.choice(['R', 'B', 'G', 'O'])
+        elif kind == 2:
+            state['choices'] = {
+                question: generator.choice(['Y', 'N', 'M']) for question in ('enjoy', 'recommend', 'learn')
+            }
+        samples.append(json.dumps(state))
+    return itertools.islice(itertools.cycle(samples), count)
+
+
+class TestDecoders(unittest.TestCase):
+    """
+    Tests for decoding votes from learners' state.
+    """
+    states = [
+        '{"choice": "R", "submissions_count": 1}',
+        '{"submissions_count": 1, "choice": "a \\"quoted\\" {key}"}',
+        '{"choice": null}',
+        '{"choices": {"q}1": "Y", "q2": "N"}, "submissions_count": 2}',
+        '{"choices": {"choices": "Y", "choice": "N"}}',
+        '{"choices" : {}, "extra": {"choice": "X"}}',
+        '{"extra": {"choice": "X"}, "choice": "R"}',
+        '{"x\\"choice": "X", "choice": "R"}',
+        '{"submissions_count": 0}',
+    ]
+
+    def test_decoders_agree(self):
+        for name, decoder in DECODERS.items():
+            for state in self.states:
+                for key in ('choice', 'choices'):
+                    self.assertEqual(decoder(state, key), json.loads(state).get(key), (name, state, key))
+
+    def test_auto(self):
+        self.assertIn(get_decoder(), DECODERS.values())
+
+    def test_rows_without_votes_skipped(self):
+        """
+        Rows without a vote are left out, and those that do not mention the key are not decoded at all.
+        """
+        decoded = []
+
+        def decoder(state, key):
+            decoded.append(state)
+            return json.loads(state).get(key)
+
+        rows = [export_row(index, json.loads(state)) for index, state in enumerate(self.states)]
+        rows.append((99, u'user99', u'user99@example.com', None))
+        self.assertEqual([row[0] for row in votes(rows, 'choice', decoder)], [0, 1, 6, 7])
+        self.assertEqual(len(decoded), 7)
+
+
+@unittest.skipUnless(os.environ.get('XBLOCK_POLL_BENCHMARK'), 'Set XBLOCK_POLL_BENCHMARK=1 to run benchmarks.')
+class TestDecoderBenchmark(unittest.TestCase):
+    """
+    Throughput of each state decoder over a synthetic corpus of a million learners' states.
+    """
+    rows = 1000000
+
+    def setUp(self):
+        super(TestDecoderBenchmark, self).setUp()
+        # Show the results on stderr, where test runners do not capture them.
+        handler = logging.StreamHandler()
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+        level = log.level
+        log.setLevel(logging.INFO)
+        self.addCleanup(log.setLevel, level)
+
+    def full_parse(self, rows, key):
+        """
+        Yield votes the way exports did before decoders: by parsing every state in full.
+        """
+        for user_id, username, email, state in rows:
+            vote = json.loads(state).get(key)
+            if vote:
+                yield user_id, username, email, vote
+
+    def test_throughput(self):
+        learner = (1, u'user1', u'user1@example.com')
+        for key in ('choice', 'choices'):
+            found = set()
+            decoders = [('full parse', None)] + sorted(DECODERS.items())
+            for name, decoder in decoders:
+                rows = (learner + (state,) for state in synthetic_states(self.rows))
+                start = time.time()
+                if decoder is None:
+                    count = sum(1 for __ in self.full_parse(rows, key))
+                else:
+                    count = sum(1 for __ in votes(rows, key, decoder))
+                elapsed = time.time() - start
+                log.info('%s %s: %.0f rows/sec (%d votes)', name, key, self.rows / elapsed, count)
+                found.add(count)
+            self.assertEqual(len(found), 1)
+
+
+class TestPrepareData(unittest.TestCase):
+    """
+    Tests for the rows produced for CSV exports.
+    """
+    def test_poll(self):
+        block = PollBlock(MockRuntime(), DictFieldData({'question': 'Favourite?'}), None)
+        rows = [export_row(1, {'choice': 'R'}), export_row(2, {'choice': 'B'}), export_row(3, {})]
+        with patch.object(PollBlock, 'export_rows', return_value=iter(rows)):
+            data = block.prepare_data()
+            self.assertEqual(next(data), ['user_id', 'username', 'user_email', 'question', 'answer'])
+            self.assertEqual(list(data), [
+                [1, 'user1', 'user1@example.com', 'Favourite?', 'Red'],
+                [2, 'user2', 'user2@example.com', 'Favourite?', 'Blue'],
+            ])
+
+    def test_survey(self):
+        """
+        Learners without choices are left out.
+        """
+        block = SurveyBlock(MockRuntime(), DictFieldData({}), None)
+        rows = [
+            export_row(1, {'choices': {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'}}),
+            export_row(2, {'submissions_count': 0}),
+        ]
+        with patch.object(SurveyBlock, 'export_rows', return_value=iter(rows)):
+            data = list(block.prepare_data())
+        self.assertEqual(data, [
+            [
+                'user_id', 'username', 'user_email', 'Are you enjoying the course?',
+                'Do you think you will learn a lot?', 'Would you recommend this course to your friends?',
+            ],
+            [1, 'user1', 'user1@example.com', 'Yes', 'Maybe', 'No'],
+        ])
+
+
+class TestExportQueries(unittest.TestCase):
+    """
+    Query count regression tests for reading StudentModule rows, against a SQLite stand-in for the LMS tables.
+    """
+    def setUp(self):
+        super(TestExportQueries, self).setUp()
+        self.model = student_module_model()
+        from django.contrib.auth.models import User  # pylint: disable=import-error
+        self.addCleanup(self.model.objects.all().delete)
+        self.addCleanup(User.objects.all().delete)
+        for index in xrange(25):
+            user = User.objects.create(username='user{}'.format(index), email='user{}@example.com'.format(index))
+            self.model.objects.create(
+                student=user, module_state_key='block', course_id='course', state=json.dumps({'choice': 'R'})
+            )
+        self.model.objects.create(student=user, module_state_key='other-block', course_id='course', state='{}')
+
+    def test_one_query_per_batch(self):
+        """
+        Learners' details come from a join, so the number of queries depends only on the batch size.
+        """
+        from django.db import connection  # pylint: disable=import-error
+        from django.test.utils import CaptureQueriesContext  # pylint: disable=import-error
+
+        queryset = self.model.objects.filter(module_state_key='block', course_id='course')
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(keyset_batches(queryset, EXPORT_FIELDS, batch_size=10))
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0], (rows[0][0], u'user0', u'user0@example.com', u'{"choice": "R"}'))
+        self.assertEqual(len(set(row[0] for row in rows)), 25)
+        for query in queries.captured_queries:
+            self.assertIn('JOIN', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_exact_multiple_of_batch_size(self):
+        """
+        A final empty batch ends the export when the row count is a multiple of the batch size.
+        """
+        from django.db import connection  # pylint: disable=import-error
+        from django.test.utils import CaptureQueriesContext  # pylint: disable=import-error
+
+        queryset = self.model.objects.filter(module_state_key='block')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(list(keyset_batches(queryset, EXPORT_FIELDS, batch_size=5))), 25)
+        self.assertEqual(len(queries), 6)
+
+
+class TestIncrementalExport(unittest.TestCase):
+    """
+    Tests for exports that only read the rows changed since the previous export.
+    """
+    def setUp(self):
+        super(TestIncrementalExport, self).setUp()
+        self.model = student_module_model()
+        from django.contrib.auth.models import User  # pylint: disable=import-error
+        from django.core.files.storage import FileSystemStorage  # pylint: disable=import-error
+        self.addCleanup(self.model.objects.all().delete)
+        self.addCleanup(User.objects.all().delete)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.storage = FileSystemStorage(location=directory)
+        self.users = [
+            User.objects.create(username='user{}'.format(index), email='user{}@example.com'.format(index))
+            for index in xrange(4)
+        ]
+        for user, choice in zip(self.users[:3], 'RBG'):
+            self.vote(user, choice)
+        self.block = PollBlock(MockRuntime(), DictFieldData({'question': 'Favourite?'}), None)
+        patcher = patch.object(
+            PollBlock, 'student_module_queryset', return_value=self.model.objects.filter(module_state_key='block')
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def vote(self, user, choice):
+        state = json.dumps({'choice': choice} if choice else {'submissions_count': 1})
+        self.model.objects.update_or_create(
+            student=user, module_state_key='block', course_id='course', defaults={'state': state}
+        )
+
+    def export(self, previous):
+        output, snapshot = write_incremental_report(
+            self.block, self.storage, snapshot_name('block'), previous, time.time()
+        )
+        rows = list(csv.reader(output))
+        output.close()
+        return rows[0], [(row[1], row[4]) for row in rows[1:]], snapshot
+
+    def test_only_changes_read(self):
+        header, rows, snapshot = self.export(None)
+        self.assertEqual(header, ['user_id', 'username', 'user_email', 'question', 'answer'])
+        self.assertEqual(rows, [('user0', 'Red'), ('user1', 'Blue'), ('user2', 'Green')])
+        self.assertEqual(snapshot['changed_rows'], 3)
+
+        # Rows last changed before the previous export started are not read again.
+        self.model.objects.update(modified=datetime.datetime(2000, 1, 1))
+        self.vote(self.users[0], 'O')
+        self.vote(self.users[1], None)
+        self.vote(self.users[3], 'R')
+
+        __, rows, snapshot = self.export(snapshot)
+        self.assertEqual(rows, [('user0', 'Other'), ('user2', 'Green'), ('user3', 'Red')])
+        self.assertEqual(snapshot['changed_rows'], 3)
+
+    def test_snapshot_replaced(self):
+        """
+        Each export saves its snapshot as a new file; the others are deleted once its result is recorded.
+        """
+        from django.core.files.base import ContentFile  # pylint: disable=import-error
+        __, __, first = self.export(None)
+        __, __, second = self.export(first)
+        other = self.storage.save(snapshot_name('other-block'), ContentFile('other'))
+        self.assertNotEqual(second['name'], first['name'])
+        self.assertTrue(self.storage.exists(first['name']))
+
+        delete_stale_snapshots(self.storage, 'block', second['name'])
+        self.assertFalse(self.storage.exists(first['name']))
+        self.assertTrue(self.storage.exists(second['name']))
+        self.assertTrue(self.storage.exists(other))
+
+    def test_snapshot_name(self):
+        """
+        Snapshot names can't be guessed from the block id.
+        """
+        self.assertNotEqual(snapshot_name('block'), snapshot_name('block'))
+
+    def test_missing_snapshot(self):
+        """
+        Every row is read again when the previous snapshot is gone.
+        """
+        __, __, snapshot = self.export(None)
+        self.storage.delete(snapshot['name'])
+        self.model.objects.update(modified=datetime.datetime(2000, 1, 1))
+        __, rows, snapshot = self.export(snapshot)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(snapshot['changed_rows'], 3)
+
+    def test_snapshot(self):
+        snapshot = Snapshot(':memory:')
+        self.assertEqual(snapshot.merge([(2, u'b', u'b@example.com', {'q': 'Y'}), (1, u'a', u'a@example.com', 'R')]), 2)
+        snapshot.merge([(2, u'b', u'b@example.com', None)])
+        self.assertEqual(list(snapshot.votes()), [(1, u'a', u'a@example.com', u'R')])
+        snapshot.close()
+
+
+class TestCourseArchive(unittest.TestCase):
+    """
+    Tests for exporting every poll and survey in a course at once.
+    """
+    def make_block(self, block_class, usage_id, rows):
+        block = block_class(
+            MockRuntime(), DictFieldData({'display_name': usage_id}), ScopeIds('staff', 'poll', 'definition', usage_id)
+        )
+        block.export_votes = lambda: iter(rows)
+        return block
+
+    def test_archive(self):
+        poll = self.make_block(PollBlock, 'poll-1', [(1, u'user1', u'user1@example.com', 'R')])
+        choices = {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'}
+        survey = self.make_block(SurveyBlock, 'survey-1', [(2, u'user2', u'user2@example.com', choices)])
+        broken = self.make_block(PollBlock, 'poll-2', [(3, u'user3', u'user3@example.com', 'unknown')])
+        progress = []
+        output = write_course_archive(
+            [('poll-1.csv', poll), ('survey-1.csv', survey), ('poll-2.csv', broken)],
+            concurrency=2, progress=lambda done, total: progress.append((done, total)),
+        )
+        archive = zipfile.ZipFile(output)
+        self.assertEqual(sorted(archive.namelist()), ['index.csv', 'poll-1.csv', 'survey-1.csv'])
+        self.assertEqual(list(csv.reader(archive.open('poll-1.csv')))[1][4], 'Red')
+        self.assertEqual(list(csv.reader(archive.open('survey-1.csv')))[1][3:], ['Yes', 'Maybe', 'No'])
+        index = list(csv.reader(archive.open('index.csv')))
+        self.assertEqual(index[0], ['file', 'usage_id', 'display_name', 'error'])
+        self.assertEqual([row[:3] for row in index[1:]], [
+            ['poll-1.csv', 'poll-1', 'poll-1'],
+            ['survey-1.csv', 'survey-1', 'survey-1'],
+            ['poll-2.csv', 'poll-2', 'poll-2'],
+        ])
+        self.assertEqual([row[3] for row in index[1:3]], ['', ''])
+        self.assertNotEqual(index[3][3], '')
+        self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+        output.close()
+
+    def test_bounded_concurrency(self):
+        """
+        No more blocks than the concurrency setting are exported at the same time.
+        """
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def rows():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return iter([])
+
+        blocks = []
+        for index in xrange(6):
+            block = self.make_block(PollBlock, 'poll-{}'.format(index), [])
+            block.export_votes = rows
+            blocks.append(('poll-{}.csv'.format(index), block))
+        write_course_archive(blocks, concurrency=2).close()
+        self.assertEqual(running[1], 2)
+
+
+class TestExportResult(unittest.TestCase):
+    """
+    Tests for how the result of a block's export is recorded.
+    """
+    def setUp(self):
+        super(TestExportResult, self).setUp()
+        patcher = patch.object(PollBlock, '_delete_stale_snapshots')
+        self.delete_stale_snapshots = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.block = PollBlock(MockRuntime(), DictFieldData({}), ScopeIds('staff', 'poll', 'definition', 'usage'))
+        self.snapshot = {'name': 'first', 'high_water_mark': 1000, 'changed_rows': 3}
+        self.block.last_export_result = {'error': None, 'report_filename': 'report.csv', 'snapshot': self.snapshot}
+
+    def test_success(self):
+        """
+        The new snapshot replaces the previous one, which is deleted.
+        """
+        snapshot = dict(self.snapshot, name='second')
+        result = {'error': None, 'report_filename': 'new.csv', 'snapshot': snapshot}
+        self.block._store_export_result(Mock(  # pylint: disable=protected-access
+            successful=Mock(return_value=True), result=result
+        ))
+        self.assertEqual(self.block.last_export_result['snapshot'], snapshot)
+        self.delete_stale_snapshots.assert_called_once_with(snapshot)
+
+    def test_failure_keeps_snapshot(self):
+        """
+        A failed export keeps the snapshot of the last good one, so the next export is still incremental.
+        """
+        self.block._store_export_result(Mock(  # pylint: disable=protected-access
+            successful=Mock(return_value=False), result=ValueError('Broken')
+        ))
+        self.assertEqual(self.block.last_export_result, {'error': 'Broken', 'snapshot': self.snapshot})
+        self.delete_stale_snapshots.assert_called_once_with(self.snapshot)
@@ -0,0 +1,109 @@
+import json
+import unittest
+from collections import Counter
+
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
+
+from poll.poll import PollBlock, SurveyBlock
+from ..utils import MockRuntime, make_request
+
+
+class CountingFieldData(DictFieldData):
+    """
+    Field data that counts the reads and writes reaching the key-value store.
+    """
+    def __init__(self, data):
+        super(CountingFieldData, self).__init__(data)
+        self.gets = Counter()
+        self.writes = []
+
+    def get(self, block, name):
+        self.gets[name] += 1
+        return super(CountingFieldData, self).get(block, name)
+
+    def set(self, block, name, value):
+        self.writes.append([name])
+        super(CountingFieldData, self).set(block, name, value)
+
+    def set_many(self, block, update_dict):
+        self.writes.append(sorted(update_dict))
+        for name, value in update_dict.items():
+            super(CountingFieldData, self).set(block, name, value)
+
+
+class TestFieldAccess(unittest.TestCase):
+    """
+    Benchmarks of the key-value store calls made by one vote.
+
+    Before votes read their fields once and wrote them once, a survey vote saved the learner's state twice,
+    and a vote for the same answer rewrote the tally.
+    """
+    def make_block(self, block_class, **stored):
+        field_data = CountingFieldData(json.loads(json.dumps(stored)))
+        block = block_class(MockRuntime(), field_data, ScopeIds('student', 'poll', 'definition', 'usage'))
+        return block, field_data
+
+    def stored_fields(self, block_class, **stored):
+        """
+        Return stored fields for a block whose tally has already been cleaned.
+        """
+        block, __ = self.make_block(block_class)
+        stored.setdefault('tally', block.blank_tally())
+        stored['tally_schema'] = block.tally_schema_key()
+        return stored
+
+    def vote(self, block, data):
+        response = json.loads(block.handle('vote', make_request(json.dumps(data))).body)
+        self.assertTrue(response['success'], response)
+
+    def assert_read_once(self, field_data):
+        self.assertEqual([name for name, count in field_data.gets.items() if count > 1], [])
+
+    def test_poll_vote(self):
+        block, field_data = self.make_block(PollBlock, **self.stored_fields(PollBlock))
+        self.vote(block, {'choice': 'R'})
+        self.assert_read_once(field_data)
+        self.assertEqual(field_data.writes, [['choice', 'submissions_count', 'tally']])
+
+    def test_poll_same_vote_again(self):
+        block, field_data = self.make_block(PollBlock, **self.stored_fields(
+            PollBlock, private_results=True, max_submissions=0, choice='R', submissions_count=1
+        ))
+        self.vote(block, {'choice': 'R'})
+        self.assert_read_once(field_data)
+        self.assertEqual(field_data.writes, [['submissions_count']])
+
+    def test_survey_vote(self):
+        block, field_data = self.make_block(SurveyBlock, **self.stored_fields(SurveyBlock))
+        self.vote(block, {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'})
+        self.assert_read_once(field_data)
+        self.assertEqual(field_data.writes, [['choices', 'submissions_count', 'tally']])
+
+    def test_survey_vote_again(self):
+        stored = self.stored_fields(
+            SurveyBlock, private_results=True, max_submissions=0, submissions_count=1,
+            choices={'enjoy': 'N', 'recommend': 'N', 'learn': 'N'},
+        )
+        for answer in stored['tally'].values():
+            answer['N'] = 1
+        block, field_data = self.make_block(SurveyBlock, **stored)
+        self.vote(block, {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'})
+        self.assert_read_once(field_data)
+        self.assertEqual(field_data.writes, [['choices', 'submissions_count', 'tally']])
+        self.assertEqual(
+            block.tally,
+            {
+                'enjoy': {'Y': 1, 'N': 0, 'M': 0},
+                'recommend': {'Y': 0, 'N': 1, 'M': 0},
+                'learn': {'Y': 0, 'N': 0, 'M': 1},
+            }
+        )
+
+    def test_survey_without_vote_is_not_written(self):
+        """
+        Learners who have not voted are not saved just to look up their choices.
+        """
+        block, field_data = self.make_block(SurveyBlock, **self.stored_fields(SurveyBlock))
+        self.assertIsNone(block.get_choices())
+        self.assertEqual(field_data.writes, [])
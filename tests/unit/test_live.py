@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+import unittest
+
+from mock import patch
+from webob import Request
+
+from poll.live import LocalBroker
+from poll.poll import PollBlock
+from ..utils import make_block, make_request
+
+
+class TestLocalBroker(unittest.TestCase):
+    """
+    Tests for the in-process publish/subscribe stand-in.
+    """
+    def test_wait_wakes_on_publish(self):
+        """
+        Waiting returns as soon as a newer message is published.
+        """
+        broker = LocalBroker()
+        timer = threading.Timer(0.05, broker.publish, ['topic', {'R': 1}])
+        timer.start()
+        start = time.time()
+        self.assertEqual(broker.wait('topic', 0, 5), (1, {'R': 1}))
+        self.assertLess(time.time() - start, 5)
+        timer.join()
+
+    def test_wait_times_out(self):
+        """
+        Waiting without any new message returns the current one after the timeout.
+        """
+        broker = LocalBroker()
+        broker.publish('topic', {'R': 1})
+        broker.publish('other', {'R': 2})
+        self.assertEqual(broker.wait('topic', 1, 0.01), (1, {'R': 1}))
+
+    def test_topics_bounded(self):
+        """
+        Only the most recently used topics are kept.
+        """
+        broker = LocalBroker(maxsize=2)
+        for topic in ('first', 'second', 'third'):
+            broker.publish(topic, {'R': 1})
+        self.assertEqual(len(broker.topics), 2)
+        self.assertEqual(broker.latest('first'), (0, None))
+        self.assertEqual(broker.latest('third'), (1, {'R': 1}))
+
+
+class TestWatchResults(unittest.TestCase):
+    """
+    Tests for the live results long-poll handler.
+    """
+    def setUp(self):
+        super(TestWatchResults, self).setUp()
+        self.field_data = {
+            'answers': [
+                ['R', {'label': 'Red', 'img': None, 'img_alt': None}],
+                ['B', {'label': 'Blue', 'img': None, 'img_alt': None}],
+            ],
+        }
+        patcher = patch.object(PollBlock, 'get_xblock_settings', return_value={'LIVE_RESULTS': True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_block(self, user_id):
+        return make_block(PollBlock, user_id, usage_id='live-usage', **self.field_data)
+
+    def watch(self, block, since, timeout):
+        request = Request.blank('/?since={}&timeout={}'.format(since, timeout))
+        return json.loads(block.handle('watch_results', request).body)
+
+    def test_changes_since_version(self):
+        """
+        A watcher is woken up by a vote, and gets only the counts that changed since its version.
+        """
+        results = json.loads(self.make_block('watcher').handle('get_results', make_request('{}')).body)
+        responses = []
+        watcher = threading.Thread(
+            target=lambda: responses.append(self.watch(self.make_block('watcher'), results['tally_version'], 5))
+        )
+        watcher.start()
+        time.sleep(0.05)
+        self.make_block('voter').handle('vote', make_request(json.dumps({'choice': 'B'})))
+        watcher.join()
+
+        response = responses[0]
+        self.assertTrue(response['changed'])
+        self.assertEqual(response['changes'], [[['B'], 1]])
+        self.assertNotEqual(response['version'], results['tally_version'])
+
+    def test_timeout_and_unknown_version(self):
+        """
+        Without changes the watcher times out; an unknown version gets the whole tally.
+        """
+        block = self.make_block('watcher')
+        current = self.watch(block, '', 0)
+        self.assertEqual(current['tally'], {'R': 0, 'B': 0})
+
+        response = self.watch(block, current['version'], 0.01)
+        self.assertFalse(response['changed'])
+        self.assertNotIn('tally', response)
+
+    def test_non_finite_timeout(self):
+        """
+        Timeouts that are not finite numbers are not waited for.
+        """
+        block = self.make_block('watcher')
+        version = self.watch(block, '', 0)['version']
+        for timeout in ('nan', 'inf', '-inf'):
+            responses = []
+            watcher = threading.Thread(target=lambda: responses.append(self.watch(block, version, timeout)))
+            watcher.daemon = True
+            watcher.start()
+            watcher.join(5)
+            self.assertFalse(watcher.is_alive(), timeout)
+            self.assertFalse(responses[0]['changed'])
+
+    def test_vote_not_published_when_disabled(self):
+        """
+        Votes are only published to watchers when LIVE_RESULTS is set.
+        """
+        with patch.object(PollBlock, 'get_xblock_settings', return_value={}), \
+                patch('poll.poll.RESULTS_BROKER') as broker:
+            self.make_block('voter').handle('vote', make_request(json.dumps({'choice': 'B'})))
+        self.assertFalse(broker.publish.called)
+
+    def test_disabled(self):
+        """
+        Watching is refused unless LIVE_RESULTS is set.
+        """
+        with patch.object(PollBlock, 'get_xblock_settings', return_value={}):
+            self.assertEqual(self.watch(self.make_block('watcher'), '', 0), {'live': False})
@@ -1,9 +1,13 @@
 import unittest
 import json
 
+from django.core.cache.backends.locmem import LocMemCache
+from mock import Mock, patch
 from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
 
-from poll.poll import PollBlock, SurveyBlock
+from poll.permissions import invalidate
+from poll.poll import PollBlock, SurveyBlock, FINGERPRINT_CACHE, MARKDOWN_CACHE, RESOURCE_CACHE, RESULTS_CACHE
 from ..utils import MockRuntime, make_request
 
 
@@ -34,9 +38,17 @@ class TestPollBlock(unittest.TestCase):
         self.poll_block = PollBlock(
             self.runtime,
             DictFieldData(self.poll_data),
-            None
+            ScopeIds('student', 'poll', 'poll-definition', 'poll-usage')
         )
 
+    def use_answers_with_images(self):
+        """
+        Give the answers the image fields that answers saved in Studio have.
+        """
+        self.poll_block.answers = [
+            [key, {'label': value['label'], 'img': None, 'img_alt': None}] for key, value in self.poll_data['answers']
+        ]
+
     def test_student_view_data(self):
         """
         Test the student_view_data results.
@@ -67,8 +79,166 @@ class TestPollBlock(unittest.TestCase):
             u'submissions_count': 5,
             u'tally': {'R': 0, 'B': 0, 'G': 0, 'O': 0},
         }
+        self.assertTrue(response.pop('version'))
         self.assertEqual(response, expected_response)
 
+    def test_student_view_user_state_since(self):
+        """
+        Given a version, only the counts that changed since then are returned.
+        """
+        self.use_answers_with_images()
+
+        def user_state(query=''):
+            request = make_request('', method='GET')
+            request.query_string = query
+            return json.loads(self.poll_block.handle('student_view_user_state', request).body)
+
+        version = user_state()['version']
+        self.assertEqual(
+            user_state('since=' + version),
+            {'version': version, 'changes': [], 'state_changed': False}
+        )
+
+        self.poll_block.handle('vote', make_request(json.dumps({'choice': 'G'})))
+        response = user_state('since=' + version)
+        self.assertEqual(response['changes'], [[['G'], 1]])
+        self.assertTrue(response['state_changed'])
+        self.assertEqual(response['choice'], 'G')
+
+        compact = user_state('encoding=compact&since=' + version)
+        self.assertEqual(compact['changes'], [[2, 1]])
+        self.assertEqual(user_state('encoding=compact&since=unknown')['counts'], [0, 0, 1, 0])
+
+    def test_studio_submit_stores_html(self):
+        """
+        Saving in Studio stores rendered HTML, so results are displayed without rendering markdown.
+        """
+        self.poll_block.handle('studio_submit', make_request(json.dumps({
+            'display_name': 'My Poll',
+            'question': '**Favorite** color?',
+            'feedback': '',
+            'private_results': False,
+            'max_submissions': 1,
+            'answers': [{'key': 'R', 'label': '*Red*'}, {'key': 'B', 'label': 'Blue'}],
+        })))
+        rendered = self.poll_block.rendered_markdown
+        self.assertEqual(rendered['question'], '<p><strong>Favorite</strong> color?</p>')
+        self.assertEqual(rendered['answers'], {'R': '<p><em>Red</em></p>', 'B': '<p>Blue</p>'})
+
+        MARKDOWN_CACHE.clear()
+        self.addCleanup(MARKDOWN_CACHE.clear)
+        results = json.loads(self.poll_block.handle('get_results', make_request('{}')).body)
+        self.assertEqual(results['question'], rendered['question'])
+        self.assertEqual([answer['answer'] for answer in results['tally']], ['<p><em>Red</em></p>', '<p>Blue</p>'])
+        self.assertEqual(MARKDOWN_CACHE.stats()['misses'], 0)
+
+    def test_item_index(self):
+        """
+        Blocks with the same answers share one index, which is rebuilt when the answers change.
+        """
+        index = self.poll_block.item_index('answers')
+        self.assertEqual(index.keys, ('R', 'B', 'G', 'O'))
+        self.assertEqual(index.label('G'), 'Green')
+        self.assertIn('O', index)
+        self.assertNotIn('X', index)
+        self.assertNotIn(['R'], index)
+
+        other_block = PollBlock(
+            MockRuntime(), DictFieldData(dict(self.poll_data)),
+            ScopeIds('other', 'poll', 'poll-definition', 'poll-usage')
+        )
+        self.assertIs(other_block.item_index('answers'), index)
+        with patch('poll.poll.hashlib.sha1') as sha1:
+            self.assertIs(other_block.item_index('answers'), index)
+        self.assertFalse(sha1.called)
+
+        self.poll_block.answers = self.poll_block.answers + [['X', {'label': 'Mauve'}]]
+        self.assertIn('X', self.poll_block.item_index('answers'))
+        self.assertNotEqual(self.poll_block.item_index('answers').fingerprint, index.fingerprint)
+
+    def test_static_resource_url(self):
+        """
+        Static resource URLs are fingerprinted with a hash of the resource content.
+        """
+        self.assertRegexpMatches(
+            self.poll_block.static_resource_url('/public/js/templates.js'),
+            r'^/resource/poll/public/js/templates.js\?v=[0-9a-f]{12}$'
+        )
+
+    def test_stale_html_rerendered(self):
+        """
+        Stored HTML that no longer matches the markdown source is ignored.
+        """
+        self.poll_block.rendered_markdown = self.poll_block.render_markdown_fields()
+        self.poll_block.question = 'A *new* question'
+        self.assertEqual(self.poll_block.rendered_markdown_fields()['question'], '<p>A <em>new</em> question</p>')
+
+    def test_results_snapshot(self):
+        """
+        Results are built once per version, and rebuilt after a vote or a settings change.
+        """
+        RESULTS_CACHE.clear()
+        self.addCleanup(RESULTS_CACHE.clear)
+        self.use_answers_with_images()
+
+        def get_results():
+            return json.loads(self.poll_block.handle('get_results', make_request('{}')).body)
+
+        with patch.object(PollBlock, 'tally_detail', wraps=self.poll_block.tally_detail) as tally_detail:
+            first = get_results()
+            self.assertEqual(get_results(), first)
+            self.assertEqual(tally_detail.call_count, 1)
+
+            self.poll_block.handle('vote', make_request(json.dumps({'choice': 'R'})))
+            results = get_results()
+            self.assertEqual(tally_detail.call_count, 2)
+            self.assertEqual(results['tally'][0]['key'], 'R')
+            self.assertTrue(results['tally'][0]['choice'])
+
+            self.poll_block.feedback = 'New feedback'
+            self.assertEqual(get_results()['feedback'], '<p>New feedback</p>')
+            self.assertEqual(tally_detail.call_count, 3)
+
+        stats = RESULTS_CACHE.stats()
+        self.assertEqual((stats['hits'], stats['builds']), (1, 3))
+        # Every view of the results is still reported.
+        views = [event for event in self.runtime.published_events if event[0] == 'xblock.poll.view_results']
+        self.assertEqual(len(views), 4)
+
+    def test_conditional_requests(self):
+        """
+        Results and user state carry an ETag, and a request with a matching If-None-Match gets a 304.
+        """
+        self.use_answers_with_images()
+        for handler, method in (('get_results', 'POST'), ('student_view_user_state', 'GET')):
+            response = self.poll_block.handle(handler, make_request('{}', method=method))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.etag)
+
+            request = make_request('{}', method=method)
+            request.headers['If-None-Match'] = response.headers['ETag']
+            cached = self.poll_block.handle(handler, request)
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.body, '')
+
+            self.poll_block.handle('vote', make_request(json.dumps({'choice': 'R'})))
+            self.assertEqual(self.poll_block.handle(handler, request).status_code, 200)
+            del self.poll_block.choice
+
+    def test_initial_state_inlined(self):
+        """
+        student_view sends the voted state, and the results once the learner has voted, with the page.
+        """
+        self.use_answers_with_images()
+        self.assertEqual(self.poll_block.initial_js_data(False), {'voted': False, 'private_results': False})
+
+        self.poll_block.handle('vote', make_request(json.dumps({'choice': 'G'})))
+        init_args = self.poll_block.initial_js_data(True)
+        self.assertTrue(init_args['voted'])
+        response = self.poll_block.handle('get_results', make_request('{}'))
+        self.assertEqual(init_args['results'], json.loads(response.body))
+        self.assertEqual(init_args['results_etag'], response.headers['ETag'])
+
 
 class TestSurveyBlock(unittest.TestCase):
     """
@@ -101,7 +271,7 @@ class TestSurveyBlock(unittest.TestCase):
         self.survey_block = SurveyBlock(
             self.runtime,
             DictFieldData(self.survery_data),
-            None
+            ScopeIds('student', 'survey', 'survey-definition', 'survey-usage')
         )
 
     def test_student_view_data(self):
@@ -139,4 +309,265 @@ class TestSurveyBlock(unittest.TestCase):
                 u'recommend': {u'M': 0, u'N': 0, u'Y': 0},
             },
         }
+        self.assertTrue(response.pop('version'))
         self.assertEqual(response, expected_response)
+
+    def test_stored_user_state(self):
+        """
+        Choices read from raw stored state are only returned while they match the questions and answers.
+        """
+        choices = {'enjoy': 'Y', 'recommend': 'N', 'learn': 'M'}
+        self.assertEqual(
+            self.survey_block.stored_user_state({'choices': choices, 'submissions_count': 1}),
+            {'choices': choices, 'submissions_count': 1}
+        )
+        self.assertEqual(
+            self.survey_block.stored_user_state({'choices': dict(choices, learn='X'), 'submissions_count': 1}),
+            {'choices': None, 'submissions_count': 1}
+        )
+        self.assertEqual(self.survey_block.stored_user_state({}), {'choices': None, 'submissions_count': 0})
+
+    def test_markdown_rendered_once(self):
+        """
+        Question labels are only run through markdown once, however often they are displayed.
+        """
+        MARKDOWN_CACHE.clear()
+        self.addCleanup(MARKDOWN_CACHE.clear)
+        self.survey_block.questions = [
+            (key, {'label': value['label'], 'img': None, 'img_alt': None})
+            for key, value in self.survery_data['questions']
+        ]
+        for __ in range(3):
+            self.survey_block.renderable_answers(None)
+        # One render per question, plus the feedback.
+        self.assertEqual(MARKDOWN_CACHE.stats()['renders'], len(self.survery_data['questions']) + 1)
+
+    def test_tally_cleaned_when_questions_change(self):
+        """
+        The tally is only cleaned again after the questions or answers change.
+        """
+        with patch.object(SurveyBlock, 'clean_tally', wraps=self.survey_block.clean_tally) as clean_tally:
+            for __ in range(3):
+                self.survey_block.current_tally()
+            self.assertEqual(clean_tally.call_count, 1)
+
+            self.survey_block.answers = self.survey_block.answers + [['D', 'Definitely']]
+            tally = self.survey_block.current_tally()
+            self.assertEqual(clean_tally.call_count, 2)
+        self.assertEqual(tally['enjoy'], {'Y': 0, 'N': 0, 'M': 0, 'D': 0})
+
+
+class TestResourceCache(unittest.TestCase):
+    """
+    Tests for the packaged resource cache.
+    """
+    def setUp(self):
+        super(TestResourceCache, self).setUp()
+        RESOURCE_CACHE.clear()
+        self.addCleanup(RESOURCE_CACHE.clear)
+        FINGERPRINT_CACHE.clear()
+        self.addCleanup(FINGERPRINT_CACHE.clear)
+        self.poll_block = PollBlock(MockRuntime(), DictFieldData({}), None)
+
+    def test_resource_loaded_once(self):
+        """
+        Repeated lookups of the same resource are served from the cache.
+        """
+        first = self.poll_block.resource_string('/public/handlebars/poll_results.handlebars')
+        second = self.poll_block.resource_string('public/handlebars/poll_results.handlebars')
+        self.assertEqual(first, second)
+        self.assertEqual(RESOURCE_CACHE.stats()['misses'], 1)
+        self.assertEqual(RESOURCE_CACHE.stats()['hits'], 1)
+
+    def test_cache_disabled(self):
+        """
+        The CACHE_RESOURCES setting turns the cache off.
+        """
+        with patch.object(PollBlock, 'get_xblock_settings', return_value={'CACHE_RESOURCES': False}):
+            self.poll_block.resource_string('public/css/poll.css')
+        self.assertEqual(len(RESOURCE_CACHE), 0)
+
+    def test_preload_resources(self):
+        """
+        Preloading fills the cache with every resource needed to render a block.
+        """
+        PollBlock.preload_resources()
+        self.poll_block.resource_string('public/js/poll.js')
+        self.assertEqual(RESOURCE_CACHE.stats()['misses'], 0)
+
+    def test_fingerprint_computed_once(self):
+        """
+        Static resource URLs are fingerprinted once per path, then served from the cache.
+        """
+        block = PollBlock(MockRuntime(), DictFieldData({}), ScopeIds('student', 'poll', 'definition', 'usage'))
+        first = block.static_resource_url('public/js/poll.js')
+        with patch('poll.poll.hashlib.sha1') as sha1:
+            self.assertEqual(block.static_resource_url('/public/js/poll.js'), first)
+        self.assertFalse(sha1.called)
+        self.assertIn('?v=', first)
+
+    def test_theme_css_loaded_once(self):
+        """
+        Theme CSS is read from the package once, then served from the cache.
+        """
+        first = Mock()
+        self.poll_block.include_theme_files(first)
+        second = Mock()
+        self.poll_block.include_theme_files(second)
+        self.assertEqual(first.add_css.call_args, second.add_css.call_args)
+        self.assertEqual(RESOURCE_CACHE.stats()['misses'], 1)
+
+    def test_settings_fetched_once(self):
+        """
+        Validating many items with images asks the settings service for the settings bucket only once.
+        """
+        settings_service = Mock()
+        settings_service.get_settings_bucket.return_value = {'IMG_ALT_MANDATORY': False}
+        self.poll_block.runtime.service = Mock(return_value=settings_service)
+        result = {'success': True, 'errors': []}
+        items = [{'key': str(index), 'label': '', 'img': '/img.png'} for index in range(50)]
+        self.assertEqual(len(self.poll_block.gather_items({'answers': items}, result, 'Answer', 'answers')), 50)
+        self.assertTrue(result['success'], result)
+        self.poll_block.include_theme_files(Mock())
+        self.assertEqual(settings_service.get_settings_bucket.call_count, 1)
+
+
+class TestPrivateResultsPermission(unittest.TestCase):
+    """
+    Tests for the cached view group check behind can_view_private_results.
+    """
+    def setUp(self):
+        super(TestPrivateResultsPermission, self).setUp()
+        self.group_profiles = Mock()
+        self.group_profiles.objects.filter.return_value.exists.return_value = True
+        cache = LocMemCache('poll-permissions', {})
+        cache.clear()
+        patchers = [
+            patch('django.core.cache.caches', {'default': cache}),
+            patch('poll.poll.HAS_GROUP_PROFILE', True),
+            patch('poll.poll.GroupProfile', self.group_profiles, create=True),
+            patch('poll.poll.settings', Mock(XBLOCK_POLL_EXTRA_VIEW_GROUPS=['viewers']), create=True),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_block(self):
+        runtime = MockRuntime()
+        runtime.user_is_staff = False
+        runtime.anonymous_student_id = 'anon-student'
+        runtime.get_real_user = Mock()
+        return PollBlock(runtime, DictFieldData({}), ScopeIds('student', 'poll', 'poll-definition', 'poll-usage'))
+
+    def test_decision_cached(self):
+        """
+        The group lookup runs once per user until the TTL expires or the groups change.
+        """
+        block = self.make_block()
+        self.assertTrue(block.can_view_private_results())
+        self.assertTrue(block.can_view_private_results())
+        self.assertTrue(self.make_block().can_view_private_results())
+        self.assertEqual(self.group_profiles.objects.filter.call_count, 1)
+
+        invalidate()
+        self.group_profiles.objects.filter.return_value.exists.return_value = False
+        self.assertTrue(block.can_view_private_results())
+        self.assertFalse(self.make_block().can_view_private_results())
+        self.assertEqual(self.group_profiles.objects.filter.call_count, 2)
+
+    def test_rebound_block(self):
+        """
+        The answer remembered for one user is not reused once the block is bound to another.
+        """
+        block = self.make_block()
+        self.assertTrue(block.can_view_private_results())
+        self.group_profiles.objects.filter.return_value.exists.return_value = False
+        block.scope_ids = ScopeIds('other-student', 'poll', 'poll-definition', 'poll-usage')
+        block.runtime.anonymous_student_id = 'anon-other-student'
+        self.assertFalse(block.can_view_private_results())
+
+    def test_cache_disabled(self):
+        """
+        With PERMISSION_CACHE_TTL set to 0, every request looks the groups up again.
+        """
+        with patch.object(PollBlock, 'get_xblock_settings', return_value={'PERMISSION_CACHE_TTL': 0}):
+            for __ in range(2):
+                self.assertTrue(self.make_block().can_view_private_results())
+        self.assertEqual(self.group_profiles.objects.filter.call_count, 2)
+
+
+class TestCourseExport(unittest.TestCase):
+    """
+    Tests for the handlers that export every poll and survey in the course.
+    """
+    def setUp(self):
+        super(TestCourseExport, self).setUp()
+        # The export task is LMS specific, so it is replaced by a mock.
+        self.tasks = Mock()
+        self.task = self.tasks.export_course_csv_data
+        patchers = [
+            patch.dict('sys.modules', {'poll.tasks': self.tasks}),
+            patch.object(PollBlock, '_report_url', return_value='/reports/export.zip'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.runtime = MockRuntime()
+        self.runtime.user_is_staff = True
+        self.runtime.course_id = 'course-v1:org+course+run'
+        self.block = PollBlock(self.runtime, DictFieldData({}), ScopeIds('staff', 'poll', 'definition', 'usage'))
+
+    def call(self, handler):
+        return json.loads(self.block.handle(handler, make_request('{}')).body)
+
+    def test_requires_staff(self):
+        """
+        Only staff may start a course export or see its status.
+        """
+        self.runtime.user_is_staff = False
+        self.assertFalse(self.call('course_csv_export')['success'])
+        self.assertFalse(self.call('get_course_export_status')['success'])
+        self.assertFalse(self.task.delay.called)
+
+    def test_export(self):
+        """
+        The export's progress is reported while it runs, then its result and download URL.
+        """
+        async_result = self.task.AsyncResult.return_value
+        async_result.ready.return_value = False
+        async_result.state = 'PENDING'
+        self.task.delay.return_value = Mock(id='task-id', ready=Mock(return_value=False))
+        status = self.call('course_csv_export')
+        self.task.delay.assert_called_once_with(u'course-v1:org+course+run')
+        self.assertTrue(status['export_pending'])
+        self.assertIsNone(status['progress'])
+
+        async_result.state = 'PROGRESS'
+        async_result.info = {'done': 1, 'total': 3}
+        status = self.call('get_course_export_status')
+        self.task.AsyncResult.assert_called_with('task-id')
+        self.assertTrue(status['export_pending'])
+        self.assertEqual(status['progress'], {'done': 1, 'total': 3})
+
+        result = {'error': None, 'report_filename': 'export.zip', 'blocks': 3}
+        async_result.ready.return_value = True
+        async_result.successful.return_value = True
+        async_result.result = result
+        status = self.call('get_course_export_status')
+        self.assertFalse(status['export_pending'])
+        self.assertIsNone(status['progress'])
+        self.assertEqual(status['last_export_result'], result)
+        self.assertEqual(status['download_url'], '/reports/export.zip')
+        self.assertEqual(self.block.last_course_export_result, result)
+        self.assertIsNone(self.block.last_export_result)
+
+    def test_failed_export(self):
+        """
+        A failed export is reported with its error.
+        """
+        self.task.delay.return_value = Mock(
+            ready=Mock(return_value=True), successful=Mock(return_value=False), result=ValueError('Broken')
+        )
+        status = self.call('course_csv_export')
+        self.assertFalse(status['export_pending'])
+        self.assertEqual(status['last_export_result'], {'error': 'Broken'})
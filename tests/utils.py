@@ -1,5 +1,9 @@
 # Test mocks and helpers
+import json
+
 from webob import Request
+from xblock.field_data import DictFieldData
+from xblock.fields import ScopeIds
 from xblock.runtime import DictKeyValueStore, KvsFieldData
 from xblock.test.tools import TestRuntime
 
@@ -21,3 +25,21 @@ class MockRuntime(TestRuntime):
     def __init__(self, **kwargs):
         field_data = kwargs.get('field_data', KvsFieldData(DictKeyValueStore()))
         super(MockRuntime, self).__init__(field_data=field_data)
+        self.published_events = []
+
+    def publish(self, block, event_type, event_data):
+        self.published_events.append((event_type, event_data))
+
+    def local_resource_url(self, block, uri):
+        return '/resource/{}/{}'.format(block.scope_ids.block_type, uri)
+
+
+def make_block(block_class, user_id='student', usage_id='poll-usage', **field_data):
+    """
+    Load a block as a new request for the given learner would, with its own copy of the stored fields.
+    """
+    return block_class(
+        MockRuntime(),
+        DictFieldData(json.loads(json.dumps(field_data))),
+        ScopeIds(user_id, 'poll', 'poll-definition', usage_id)
+    )